@@ -0,0 +1,186 @@
+# Benchmarks for the operations in learn_pandas.py at bigger sizes.
+# Each section of the notes (selection, conditionals, summaries,
+# grouping, sorting, missing data, renaming) is run on synthetic
+# salary tables of 1e3 to 1e7 rows. Wall time (best of a few runs)
+# and peak memory (tracemalloc, which sees numpy/pandas buffers) are
+# written to json, and a run can be compared against a saved baseline.
+#
+# Usage:
+#   python3 bench_pandas.py --out bench.json
+#   python3 bench_pandas.py --sizes 1000 100000 --baseline bench.json
+# The second command exits with status 1 if anything got slower or
+# uses more memory than the baseline (by more than --tolerance).
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+NAMES = ['Alice', 'Bob', 'Charlie', 'David', 'Emma', 'Eve', 'Frank', 'Grace', 'Hannah']
+CITIES = ['Chicago', 'Houston', 'Los Angeles', 'Miami', 'New York', 'Phoenix']
+
+
+def make_salaries(n, seed=0):
+    '''A table shaped like csv_files/sample_pandas_data.csv with n rows.'''
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ID': np.arange(1, n + 1),
+        'Name': pd.Series(NAMES).take(rng.integers(0, len(NAMES), n)).to_numpy(),
+        'Age': rng.integers(18, 60, n),
+        'City': pd.Series(CITIES).take(rng.integers(0, len(CITIES), n)).to_numpy(),
+        'Salary': rng.integers(40_000, 100_000, n),
+    })
+
+
+## Benchmarks ########################################################
+# one function per operation, named after the section of the notes
+BENCHMARKS = {
+    # Indexing in Pandas
+    'iloc_rows': lambda df: df.iloc[[1, 3, 5]],
+    'iloc_slice_col': lambda df: df.iloc[:, 1],
+    'loc_cols': lambda df: df.loc[:, ['Name', 'City', 'Salary']],
+    'loc_rows_cols': lambda df: df.loc[[1, 3, 5], ['Name', 'City']],
+    # Conditional Selection
+    'mask_eq': lambda df: df.loc[df.Name == 'Frank'],
+    'mask_and': lambda df: df.loc[(df.Name == 'Frank') & (df.Salary >= 50000)],
+    'mask_or': lambda df: df.loc[(df.Name == 'Frank') | (df.Name == 'Grace')],
+    'isin': lambda df: df.loc[df.Name.isin(['Frank', 'Grace'])],
+    'notnull': lambda df: df.loc[df.Salary.notnull()],
+    # Summary Functions
+    'describe': lambda df: df.describe(),
+    'describe_str': lambda df: df.Name.describe(),
+    'mean': lambda df: df.Salary.mean(),
+    'unique': lambda df: df.Name.unique(),
+    'value_counts': lambda df: df.Name.value_counts(),
+    # Map Functions
+    'demean': lambda df: df.Salary - df.Salary.mean(),
+    'concat_str': lambda df: df.Name + ' - ' + df.City,
+    # Grouping
+    'groupby_count': lambda df: df.groupby('Age').Age.count(),
+    'groupby_max': lambda df: df.groupby('Age').Salary.max(),
+    'groupby_agg': lambda df: df.groupby(['City']).Salary.agg(['size', 'min', 'max']),
+    'groupby_describe': lambda df: df.groupby(['City', 'Age']).describe(),
+    # Sorting
+    'sort_values': lambda df: df.sort_values(by='Salary'),
+    'sort_values_desc': lambda df: df.sort_values(by='Salary', ascending=False),
+    'sort_multi': lambda df: df.sort_values(by=['City', 'Salary'], ascending=False),
+    'sort_index': lambda df: df.sort_index(),
+    # Data Types
+    'astype_float': lambda df: df.Salary.astype('float64'),
+    'astype_str': lambda df: df.Salary.astype('str'),
+    # Missing Data
+    'fillna': lambda df: df.City.fillna('Unknown'),
+    'replace': lambda df: df.City.replace('Los Angeles', 'LA'),
+    'fillna_groupby_size': lambda df: (
+        df.fillna('Unknown').groupby('City').size().sort_values(ascending=False)
+    ),
+    # Renaming
+    'rename_cols': lambda df: df.rename(columns={'Name': 'FirstName'}),
+    'rename_index': lambda df: df.rename(index={0: 'FirstEntry', 1: 'SecondEntry'}),
+    'rename_axis': lambda df: df.rename_axis('entries', axis='rows').rename_axis('fields', axis='columns'),
+}
+
+
+def measure(func, df, repeat=3):
+    '''Returns (best wall time in seconds, peak bytes allocated).'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+
+    # memory is measured on a separate run since tracing slows it down
+    tracemalloc.start()
+    try:
+        func(df)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run_suite(sizes=SIZES, names=None, repeat=3, verbose=True):
+    '''Runs the benchmarks for every size. Returns a list of result dicts.'''
+    names = names or list(BENCHMARKS)
+    results = []
+    for n in sizes:
+        df = make_salaries(n)
+        # the biggest sizes get fewer repeats
+        n_repeat = repeat if n <= 10**6 else 1
+        for name in names:
+            seconds, peak = measure(BENCHMARKS[name], df, n_repeat)
+            results.append({'name': name, 'rows': n, 'seconds': seconds, 'peak_bytes': peak})
+            if verbose:
+                print('{:<22} {:>10,} rows {:>10.4f} s {:>10.1f} MB'.format(
+                    name, n, seconds, peak / 2**20))
+    return results
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump({
+            'python': sys.version.split()[0],
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, tolerance=1.25, min_seconds=1e-3):
+    '''
+    Returns the results that are more than tolerance times slower (or
+    bigger) than the baseline as (name, rows, metric, old, new) tuples.
+    Timings under min_seconds are too noisy and aren't compared.
+    '''
+    old = {(r['name'], r['rows']): r for r in baseline}
+    regressions = []
+    for r in results:
+        before = old.get((r['name'], r['rows']))
+        if before is None:
+            continue
+        if max(r['seconds'], before['seconds']) >= min_seconds \
+                and r['seconds'] > before['seconds'] * tolerance:
+            regressions.append((r['name'], r['rows'], 'seconds', before['seconds'], r['seconds']))
+        if r['peak_bytes'] > before['peak_bytes'] * tolerance:
+            regressions.append((r['name'], r['rows'], 'peak_bytes', before['peak_bytes'], r['peak_bytes']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the learn_pandas.py operations.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='json file to write results to')
+    parser.add_argument('--baseline', help='json file from an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.only, args.repeat)
+    if args.out:
+        save_results(results, args.out)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for name, rows, metric, before, after in regressions:
+            print('REGRESSION {} ({:,} rows) {}: {:.4g} -> {:.4g}'.format(
+                name, rows, metric, before, after))
+        if regressions:
+            return 1
+        print('no regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# Histogram + KDE plots drawn from binned summaries.
+# sns.histplot(..., kde=True) needs every sample in memory and its KDE
+# costs (samples x grid points). Here the data is first reduced to a
+# fine histogram in one streaming pass (counts can be merged between
+# chunks and processes). Until the min and max are known, bins have a
+# power of 2 width and start at a multiple of it, so a histogram can
+# be coarsened exactly (pairs of bins added up) when more data widens
+# the range. The plotted bins and a KDE are then computed
+# from that histogram alone, the KDE by convolving the counts with a
+# gaussian kernel using the FFT. Plots are drawn with the Agg renderer
+# and look like the seaborn ones in data_cleaning.py.
+#
+# Usage:
+#   original = summarize(np.array_split(data, 10))
+#   scaled = summarize(np.array_split(scaled_data, 10))
+#   render_figures([
+#       ('plots/scaled.png', [(original, 'Original Data'), (scaled, 'Scaled Data')]),
+#   ], workers=2)
+from functools import partial
+
+import numpy as np
+
+from chunking import bounded_map
+from incremental_scaling import as_1d, iter_chunks
+
+# 5040 has lots of divisors, so most bin counts picked for the plot
+# can be made by adding up whole fine bins
+FINE_BINS = 5040
+
+
+def _grid(lo, hi, fine_bins, width=0.0):
+    '''
+    (width, first bin) of the grid of fine_bins bins that covers
+    lo..hi, with a power of 2 width (at least width) and bins starting
+    at multiples of it.
+    '''
+    # constant data gets a span of 1, like np.histogram
+    span = (hi - lo) or 1.0
+    width = max(width, 2.0**np.ceil(np.log2(span / fine_bins)))
+    while np.floor(hi / width) - np.floor(lo / width) >= fine_bins:
+        width *= 2
+    return width, int(np.floor(lo / width))
+
+
+class BinnedSummary:
+    '''
+    Fine histogram of data in [lo, hi] plus the count, sum and sum of
+    squares needed for the KDE bandwidth. Merge summaries with +.
+    Summaries made with on_grid() can also be merged when their ranges
+    differ.
+    '''
+
+    def __init__(self, lo, hi, fine_bins=FINE_BINS):
+        self.lo, self.hi = float(lo), float(hi)
+        if self.hi == self.lo:
+            # constant data, give it some width like np.histogram does
+            self.lo, self.hi = self.lo - .5, self.hi + .5
+        self.counts = np.zeros(fine_bins, dtype='int64')
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.data_min, self.data_max = np.inf, -np.inf
+        self.grid = None # (width, first bin) for on_grid() summaries
+
+    @classmethod
+    def on_grid(cls, width, first, fine_bins=FINE_BINS):
+        summary = cls(first * width, (first + fine_bins) * width, fine_bins)
+        summary.grid = width, first
+        return summary
+
+    def regrid(self, width, first):
+        '''This summary on a coarser (or the same) grid.'''
+        old_width, old_first = self.grid
+        ratio = int(round(width / old_width))
+        fine_bins = len(self.counts)
+        summary = BinnedSummary.on_grid(width, first, fine_bins)
+        # bin i here is bin (old_first + i) // ratio of the whole line
+        bins = (old_first + np.arange(fine_bins)) // ratio - first
+        summary.counts = np.bincount(bins, weights=self.counts, minlength=fine_bins).astype('int64')
+        summary.n, summary.total, summary.total_sq = self.n, self.total, self.total_sq
+        summary.data_min, summary.data_max = self.data_min, self.data_max
+        return summary
+
+    def fit_to_data(self):
+        '''
+        The summary re-binned over data_min..data_max (what np.histogram
+        would use), spreading each bin's count evenly over its width.
+        '''
+        fitted = BinnedSummary(self.data_min, self.data_max, len(self.counts))
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        # the bins holding the min and max only have data up to them
+        edges = np.clip(self.edges, self.data_min, self.data_max)
+        fitted.counts = np.diff(np.interp(fitted.edges, edges, cumulative))
+        if self.data_min == self.data_max:
+            # constant data all goes in the bin np.histogram would use
+            fitted.counts = np.histogram([self.data_min], bins=fitted.edges)[0] * self.n
+        fitted.n, fitted.total, fitted.total_sq = self.n, self.total, self.total_sq
+        fitted.data_min, fitted.data_max = self.data_min, self.data_max
+        return fitted
+
+    @property
+    def edges(self):
+        return np.linspace(self.lo, self.hi, len(self.counts) + 1)
+
+    def partial_fit(self, chunk):
+        x = as_1d(chunk)
+        x = x[~np.isnan(x)]
+        if len(x) == 0:
+            return self
+        counts, _ = np.histogram(x, bins=len(self.counts), range=(self.lo, self.hi))
+        self.counts += counts
+        self.n += len(x)
+        self.total += x.sum()
+        self.total_sq += (x**2).sum()
+        self.data_min = min(self.data_min, x.min())
+        self.data_max = max(self.data_max, x.max())
+        return self
+
+    def __add__(self, other):
+        if self.grid and other.grid and self.grid != other.grid and len(self.counts) == len(other.counts):
+            # coarsen both to a grid that covers both ranges
+            width, first = _grid(min(self.data_min, other.data_min), max(self.data_max, other.data_max),
+                                 len(self.counts), max(self.grid[0], other.grid[0]))
+            return self.regrid(width, first) + other.regrid(width, first)
+        if (self.lo, self.hi, len(self.counts)) != (other.lo, other.hi, len(other.counts)):
+            raise ValueError('can only merge summaries with the same bins')
+        merged = BinnedSummary(self.lo, self.hi, len(self.counts))
+        merged.counts = self.counts + other.counts
+        merged.n = self.n + other.n
+        merged.total = self.total + other.total
+        merged.total_sq = self.total_sq + other.total_sq
+        merged.data_min = min(self.data_min, other.data_min)
+        merged.data_max = max(self.data_max, other.data_max)
+        merged.grid = self.grid
+        return merged
+
+    def std(self):
+        if self.n < 2:
+            return 0.0 # a single point has no spread (the KDE is left flat)
+        # ddof=1 like scipy's gaussian_kde
+        var = (self.total_sq - self.total**2 / self.n) / (self.n - 1)
+        return np.sqrt(max(var, 0))
+
+    def quantile(self, q):
+        '''Approximate quantile, accurate to about one fine bin.'''
+        cdf = np.concatenate([[0], np.cumsum(self.counts)]) / self.n
+        return np.interp(q, cdf, self.edges)
+
+    ## Histogram ##
+    def histogram(self):
+        '''
+        Bins like np.histogram_bin_edges(x, 'auto') (what seaborn
+        uses), snapped to a number of bins that divides the fine
+        histogram. Returns (counts, edges).
+        '''
+        n_fine = len(self.counts)
+        span = self.hi - self.lo
+        # 'auto' takes the smaller bin width of sturges and
+        # freedman-diaconis (fd is skipped when the iqr is 0)
+        width = span / (np.log2(self.n) + 1)
+        iqr = self.quantile(.75) - self.quantile(.25)
+        if iqr > 0:
+            width = min(width, 2 * iqr * self.n**(-1/3))
+        wanted = n_fine / max(1, np.ceil(span / width))
+
+        divisors = np.array([d for d in range(1, n_fine + 1) if n_fine % d == 0])
+        step = divisors[np.argmin(np.abs(divisors - wanted))]
+        counts = self.counts.reshape(-1, step).sum(axis=1)
+        return counts, self.edges[::step]
+
+    ## KDE ##
+    def kde(self, gridsize=200):
+        '''
+        Gaussian KDE with scott's bandwidth (seaborn's default) from
+        the fine histogram. Returns (support, density) with the support
+        between the data min and max (histplot uses cut=0).
+        '''
+        edges = self.edges
+        h = edges[1] - edges[0]
+        centers = edges[:-1] + h/2
+        bw = self.std() * self.n**(-1/5)
+        support = np.linspace(self.data_min, self.data_max, gridsize)
+        if bw == 0:
+            return support, np.zeros(gridsize)
+
+        # kernel sampled at the fine bin spacing, zero padding to twice
+        # the length keeps the circular FFT convolution from wrapping
+        n_fine = len(self.counts)
+        offsets = np.arange(-n_fine + 1, n_fine) * h
+        kernel = np.exp(-.5 * (offsets / bw)**2) / (bw * np.sqrt(2 * np.pi))
+        size = 2 * n_fine - 1 + n_fine
+        smoothed = np.fft.irfft(
+            np.fft.rfft(self.counts, size) * np.fft.rfft(kernel, size), size
+        )[n_fine - 1:2 * n_fine - 1]
+        density = np.clip(smoothed, 0, None) / self.n
+        return support, np.interp(support, centers, density)
+
+
+def summarize(source, value_range=None, workers=1, fine_bins=FINE_BINS):
+    '''
+    Builds a BinnedSummary from chunks of data (a list of arrays or a
+    function returning an iterator of them) in one pass. Without
+    value_range each chunk is binned over its own range on a power of 2
+    grid, grids are coarsened as they are merged, and the result is
+    re-binned over the data's min..max (to within about two fine bins).
+    '''
+    fit_chunk = partial(_summarize_chunk, value_range, fine_bins)
+    summary = BinnedSummary(*value_range, fine_bins) if value_range is not None else None
+    for part in bounded_map(fit_chunk, iter_chunks(source), workers):
+        if part is not None:
+            summary = part if summary is None else summary + part
+    if summary is None:
+        raise ValueError('no values to summarize')
+    return summary if value_range is not None else summary.fit_to_data()
+
+
+def _summarize_chunk(value_range, fine_bins, chunk):
+    if value_range is not None:
+        return BinnedSummary(*value_range, fine_bins).partial_fit(chunk)
+    x = as_1d(chunk)
+    x = x[~np.isnan(x)]
+    if len(x) == 0:
+        return None
+    return BinnedSummary.on_grid(*_grid(x.min(), x.max(), fine_bins), fine_bins).partial_fit(x)
+
+
+## Drawing ###########################################################
+def draw_hist(ax, summary, title=None, color='C0'):
+    '''Draws a summary on ax the way sns.histplot(kde=True) would.'''
+    from matplotlib.colors import to_rgba
+
+    counts, edges = summary.histogram()
+    widths = np.diff(edges)
+    bars = ax.bar(
+        edges[:-1], counts, widths, align='edge',
+        facecolor=to_rgba(color, .5), edgecolor='black',
+    )
+    # seaborn makes the outlines thinner when bars are narrow
+    bar_points = ax.bbox.width / len(counts) * 72 / ax.figure.dpi
+    for bar in bars:
+        bar.set_linewidth(max(.5, min(.1 * bar_points, 1)))
+
+    # the KDE is scaled to match the bar heights (stat='count')
+    support, density = summary.kde()
+    ax.plot(support, density * summary.n * widths[0], color=to_rgba(color, 1))
+    ax.set_ylabel('Count')
+    if title is not None:
+        ax.set_title(title)
+
+
+def render_figure(path, panels, figsize=(15, 3)):
+    '''
+    Saves a row of histograms to path. panels is a list of
+    (summary, title) pairs, one per subplot.
+    '''
+    # Figure + Agg canvas directly instead of pyplot, so nothing needs
+    # a display and figures in different processes don't share state
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(1, len(panels), squeeze=False)[0]
+    for ax, (summary, title) in zip(axes, panels):
+        draw_hist(ax, summary, title)
+    fig.savefig(path)
+    return path
+
+
+def _render_job(job):
+    return render_figure(*job)
+
+
+def render_figures(jobs, workers=1):
+    '''
+    Renders (path, panels) jobs, each figure in its own process when
+    workers > 1. Returns the saved paths.
+    '''
+    return list(bounded_map(_render_job, jobs, workers))
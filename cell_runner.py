@@ -0,0 +1,326 @@
+# Re-running the notes scripts without redoing the unchanged parts.
+# The script is split into cells at its "## Section ####" markers.
+# Before a cell runs, a key is made from its code, the values of the
+# variables it reads and the contents of any files it names
+# ('csv_files/...'). If that key was seen before, the cell isn't run:
+# the variables it set and what it printed are loaded from the cache
+# (.cell_cache) instead. So after editing one section, only that cell
+# runs, plus later cells whose inputs it changed.
+#
+# What a cell writes is worked out while it runs: variables it created
+# or rebound, and variables it read that changed in place (like
+# sals['Name'] = 'Oscar'). Cells whose results can't be pickled (e.g.
+# they define classes) are always run. Files a cell writes and plots
+# it shows are not replayed from the cache.
+#
+# Usage:
+#   python3 cell_runner.py learn_pandas.py
+#   python3 cell_runner.py data_cleaning.py -- --no-plots
+#   python3 -i cell_runner.py learn_pandas.py
+#   >>> salaries.head()   # the script's variables are available
+#   >>> rerun()           # after editing the script
+import argparse
+import ast
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import time
+import types
+from contextlib import redirect_stdout
+from io import StringIO
+
+from cleaning_pipeline import ArtifactCache, hash_data
+from section_profiler import split_sections
+
+CACHE_DIR = '.cell_cache'
+
+
+class Cell:
+    def __init__(self, name, first_line, source):
+        self.name = name
+        self.first_line = first_line
+        self.source = source
+        tree = ast.parse(source)
+        self.reads = set()
+        self.files = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                self.reads.add(node.id)
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str) \
+                    and len(node.value) < 256 and os.path.isfile(node.value):
+                self.files.add(node.value)
+
+    def compile(self, filename):
+        # pad so tracebacks point at the right line of the script
+        return compile('\n' * (self.first_line - 1) + self.source, filename, 'exec')
+
+
+def split_cells(source):
+    '''Cells of a script, one per ## section (plus the lines before the first).'''
+    lines = source.splitlines(keepends=True)
+    sections = split_sections(source)
+    cells = []
+    for (name, first), (_, stop) in zip(sections, sections[1:] + [(None, len(lines) + 1)]):
+        text = ''.join(lines[first - 1:stop - 1])
+        if text.strip():
+            cells.append(Cell(name, first, text))
+    return cells
+
+
+## Hashing ###########################################################
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+
+def _const_repr(const):
+    # set literals become frozensets, whose order changes from one
+    # python process to the next
+    if isinstance(const, frozenset):
+        return 'frozenset({})'.format(sorted(map(_const_repr, const)))
+    if isinstance(const, tuple):
+        return repr(tuple(map(_const_repr, const)))
+    return repr(const)
+
+
+def _hash_code(code, h):
+    # marshal.dumps isn't stable once code has been through the cache,
+    # so hash the parts that decide what it does
+    for c in _code_objects(code):
+        h.update(c.co_code)
+        h.update(repr((c.co_name, c.co_names, c.co_varnames, c.co_freevars, c.co_cellvars)).encode())
+        h.update(repr([_const_repr(k) for k in c.co_consts if not isinstance(k, types.CodeType)]).encode())
+
+
+def hash_value(value, namespace, _seen=None):
+    '''
+    Content hash of a variable, or None if it can't be hashed. A
+    function's hash covers its code and the globals it uses.
+    '''
+    if isinstance(value, types.ModuleType):
+        return 'module:' + value.__name__
+    if isinstance(value, types.FunctionType):
+        seen = _seen if _seen is not None else set()
+        if id(value) in seen:
+            return 'recursive'
+        seen.add(id(value))
+        h = hashlib.sha256(repr(value.__defaults__).encode())
+        _hash_code(value.__code__, h)
+        for code in _code_objects(value.__code__):
+            for name in code.co_names:
+                if name in namespace and namespace[name] is not value:
+                    inner = hash_value(namespace[name], namespace, seen)
+                    if inner is None:
+                        return None
+                    h.update((name + inner).encode())
+        return h.hexdigest()
+    if isinstance(value, type):
+        return None
+    if isinstance(value, (set, frozenset)):
+        return hashlib.sha256(_const_repr(frozenset(value)).encode()).hexdigest()
+    try:
+        return hash_data(value)
+    except Exception:
+        return None
+
+
+def _input_hashes(cell, namespace):
+    hashes = {}
+    for name in sorted(cell.reads & set(namespace)):
+        if name.startswith('__'):
+            continue
+        hashes[name] = hash_value(namespace[name], namespace)
+    return hashes
+
+
+class _ModuleRef:
+    '''Stands in for a module in the cache (modules don't pickle).'''
+
+    def __init__(self, name):
+        self.name = name
+
+    def restore(self, namespace):
+        return __import__(self.name, fromlist=['_'])
+
+
+class _FunctionRef:
+    '''
+    Stands in for a function defined by the script (they don't pickle
+    since they aren't in an importable module). Its code is kept and
+    the function is rebuilt on the script's namespace.
+    '''
+
+    def __init__(self, func):
+        self.code = marshal.dumps(func.__code__)
+        self.defaults = func.__defaults__
+        self.kwdefaults = func.__kwdefaults__
+        self.doc = func.__doc__
+
+    def restore(self, namespace):
+        code = marshal.loads(self.code)
+        func = types.FunctionType(code, namespace, code.co_name, self.defaults)
+        func.__kwdefaults__ = self.kwdefaults
+        func.__doc__ = self.doc
+        return func
+
+
+def _to_cache(value, namespace):
+    if isinstance(value, types.ModuleType):
+        return _ModuleRef(value.__name__)
+    # functions from other modules pickle fine as a reference
+    if isinstance(value, types.FunctionType) and value.__globals__ is namespace \
+            and value.__closure__ is None:
+        return _FunctionRef(value)
+    return value
+
+
+class _Tee(StringIO):
+    '''Captures what a cell prints while still printing it.'''
+
+    def __init__(self, out):
+        super().__init__()
+        self.out = out
+
+    def write(self, text):
+        self.out.write(text)
+        return super().write(text)
+
+
+## Runner ############################################################
+class CellRunner:
+    def __init__(self, path, cache_dir=CACHE_DIR, max_bytes=1 << 30, argv=()):
+        self.path = os.path.abspath(path)
+        self.argv = list(argv)
+        # absolute, since run() changes into the script's folder
+        self.cache = ArtifactCache(os.path.abspath(cache_dir), max_bytes)
+        self.last_run = [] # (cell name, 'ran' / 'cached' / 'ran, not cacheable', seconds)
+
+    def cells(self):
+        with open(self.path) as f:
+            return split_cells(f.read())
+
+    def _key(self, cell, inputs):
+        h = hashlib.sha256(cell.source.encode())
+        h.update(repr(sorted(inputs.items())).encode())
+        for path in sorted(cell.files):
+            h.update(hash_data(path).encode())
+        h.update(repr(self.argv).encode())
+        return h.hexdigest()
+
+    def _restore(self, key, namespace):
+        saved = self.cache.load(key)
+        for name, value in saved['values'].items():
+            if isinstance(value, (_ModuleRef, _FunctionRef)):
+                value = value.restore(namespace)
+            namespace[name] = value
+        for name in saved['deleted']:
+            namespace.pop(name, None)
+        sys.stdout.write(saved['stdout'])
+
+    def _execute(self, cell, namespace, inputs):
+        before = dict(namespace)
+        out = _Tee(sys.stdout)
+        with redirect_stdout(out):
+            exec(cell.compile(self.path), namespace)
+
+        written = {
+            name: value for name, value in namespace.items()
+            if not name.startswith('__') and (name not in before or before[name] is not value)
+        }
+        # reads that were changed in place count as writes too
+        for name, old_hash in inputs.items():
+            if name not in written and name in namespace \
+                    and hash_value(namespace[name], namespace) != old_hash:
+                written[name] = namespace[name]
+        deleted = [name for name in before if name not in namespace]
+        values = {name: _to_cache(v, namespace) for name, v in written.items()}
+        return {'values': values, 'deleted': deleted, 'stdout': out.getvalue()}
+
+    def run(self, namespace=None):
+        '''
+        Runs the script cell by cell, loading cached cells instead of
+        running them. Returns the namespace with the script's variables.
+        '''
+        namespace = {} if namespace is None else namespace
+        namespace.update({'__name__': '__main__', '__file__': self.path})
+        self.last_run = []
+        old_argv, old_cwd, old_path = sys.argv, os.getcwd(), list(sys.path)
+        # the scripts read files relative to where they live
+        folder = os.path.dirname(self.path)
+        sys.argv = [self.path] + self.argv
+        os.chdir(folder)
+        sys.path.insert(0, folder)
+        try:
+            for cell in self.cells():
+                start = time.perf_counter()
+                inputs = _input_hashes(cell, namespace)
+                key = None if None in inputs.values() else self._key(cell, inputs)
+                if key is not None and self.cache.meta(key) is not None:
+                    self._restore(key, namespace)
+                    status = 'cached'
+                else:
+                    result = self._execute(cell, namespace, inputs)
+                    status = 'ran'
+                    if key is None:
+                        status = 'ran, not cacheable'
+                    else:
+                        try:
+                            self.cache.save(key, result, {'cell': cell.name, 'script': self.path})
+                        except (pickle.PicklingError, TypeError, AttributeError):
+                            status = 'ran, not cacheable'
+                self.last_run.append((cell.name, status, time.perf_counter() - start))
+        finally:
+            sys.argv, sys.path[:] = old_argv, old_path
+            os.chdir(old_cwd)
+        return namespace
+
+    def print_status(self, file=sys.stderr):
+        for name, status, seconds in self.last_run:
+            print('{:<20} {:>9.1f} ms  {}'.format(status, seconds * 1000, name), file=file)
+
+
+## Interactive use ###################################################
+_runner = None
+
+
+def _export(namespace):
+    # python3 -i gives a prompt in __main__, so put the variables there
+    sys.modules['__main__'].__dict__.update(
+        {k: v for k, v in namespace.items() if not k.startswith('__')})
+
+
+def rerun():
+    '''From python3 -i: runs the changed cells again and updates the prompt's variables.'''
+    namespace = {}
+    try:
+        _runner.run(namespace)
+    finally:
+        _runner.print_status()
+        _export(namespace)
+
+
+def main(argv=None):
+    global _runner
+    parser = argparse.ArgumentParser(description='Run a notes script, skipping unchanged sections.')
+    parser.add_argument('script', help='script to run (arguments for it go after --)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--max-bytes', type=int, default=1 << 30, help='cache size limit')
+    # everything after -- goes to the script
+    argv = sys.argv[1:] if argv is None else list(argv)
+    split = argv.index('--') if '--' in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+
+    _runner = CellRunner(args.script, args.cache_dir, args.max_bytes, argv[split + 1:])
+    rerun()
+
+
+if __name__ == '__main__':
+    # go through the importable module, so the cache refers to
+    # cell_runner._ModuleRef and not __main__._ModuleRef
+    import cell_runner
+    rerun = cell_runner.rerun
+    cell_runner.main()
@@ -0,0 +1,44 @@
+# Helpers for working through csv files a chunk at a time.
+# Files that don't fit in memory can be read in pieces with
+# pd.read_csv(..., chunksize=n), reduced to a small summary per piece,
+# and the summaries combined at the end.
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+
+def iter_csv_chunks(path, chunksize=100_000, **read_kwargs):
+    '''
+    Yields DataFrames of at most chunksize rows from a csv file.
+    Extra keyword arguments are passed on to pd.read_csv.
+    '''
+    with pd.read_csv(path, chunksize=chunksize, **read_kwargs) as reader:
+        yield from reader
+
+
+def bounded_map(func, items, workers=1, max_pending=None, threads=False):
+    '''
+    Same as map(func, items) but spread over worker processes.
+
+    Only max_pending items (default 2 per worker) are in flight at
+    once, so a lazy iterator of chunks is never pulled into memory
+    all at once. Results come back in the same order as items.
+    func must be defined at module level so it can be pickled.
+    threads=True uses threads instead, for work that releases the GIL
+    (like parsing a csv) and results that are costly to pickle.
+    '''
+    if workers <= 1:
+        yield from map(func, items)
+        return
+
+    max_pending = max_pending or 2 * workers
+    executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor(workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
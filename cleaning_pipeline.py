@@ -0,0 +1,252 @@
+# Cached version of the cleaning steps in data_cleaning.py.
+# A pipeline is a list of stages that each take the previous stage's
+# output. Every stage's output is saved in an on-disk cache under a
+# key made from a hash of its input data, its parameters and its
+# source code (and that of the modules it calls into). Re-running
+# only recomputes a stage when one of those changed, and stages after
+# it only recompute if its output changed.
+# The cache is kept under max_bytes by deleting the least recently
+# used artifacts.
+#
+# Usage:
+#   pipeline = employee_pipeline()
+#   df = pipeline.run('csv_files/dirty_data.csv')
+#   pipeline.last_run # which stages were cached / recomputed
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.pipeline_cache'
+
+
+## Hashing ###########################################################
+def hash_data(data):
+    '''Content hash of a DataFrame, Series, array, file path or object.'''
+    h = hashlib.sha256()
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        # hash_pandas_object hashes every row in vectorized code
+        h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        if isinstance(data, pd.DataFrame):
+            h.update(repr(list(data.columns)).encode())
+            h.update(repr(list(data.dtypes.astype(str))).encode())
+        else:
+            h.update(repr((data.name, str(data.dtype))).encode())
+    elif isinstance(data, np.ndarray):
+        h.update(repr((data.shape, str(data.dtype))).encode())
+        h.update(np.ascontiguousarray(data).tobytes())
+    elif isinstance(data, str) and os.path.isfile(data):
+        # a file path is hashed by its contents, not its name
+        with open(data, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    else:
+        h.update(pickle.dumps(data))
+    return h.hexdigest()
+
+
+def hash_code(func):
+    '''Hash of a function's source (or bytecode if there is no source).'''
+    try:
+        code = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        code = func.__code__.co_code
+    return hashlib.sha256(code).hexdigest()
+
+
+def hash_module(name):
+    '''Hash of a module's source file, found without importing it.'''
+    spec = importlib.util.find_spec(name)
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        raise ValueError('no source file for module {!r}'.format(name))
+    with open(spec.origin, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+## Cache #############################################################
+class ArtifactCache:
+    '''
+    Pickled stage outputs in a folder, each with a small json file
+    holding the hash of the output. Reading an artifact marks it as
+    recently used, and evict() deletes the least recently used ones
+    until the folder is under max_bytes.
+    '''
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def meta(self, key):
+        '''Returns the saved metadata for key, or None if not cached.'''
+        meta_path = self._path(key, '.json')
+        if not os.path.exists(meta_path) or not os.path.exists(self._path(key, '.pkl')):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self._touch(key)
+        return meta
+
+    def load(self, key):
+        self._touch(key)
+        with open(self._path(key, '.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, key, data, meta):
+        # write to a temp file first so a crash never leaves half an artifact
+        tmp = self._path(key, '.pkl.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key, '.pkl'))
+        with open(self._path(key, '.json'), 'w') as f:
+            json.dump(meta, f)
+        self.evict(keep=key)
+
+    def _touch(self, key):
+        now = time.time()
+        for ext in ('.pkl', '.json'):
+            if os.path.exists(self._path(key, ext)):
+                os.utime(self._path(key, ext), (now, now))
+
+    def entries(self):
+        '''(last used, size, key) for every artifact, oldest first.'''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, name[:-len('.pkl')]))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        '''Deletes least recently used artifacts until under max_bytes.'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for ext in ('.pkl', '.json'):
+                if os.path.exists(self._path(key, ext)):
+                    os.remove(self._path(key, ext))
+            total -= size
+
+
+## Pipeline ##########################################################
+class Stage:
+    '''
+    One step of a pipeline: func(previous_output, **params). uses names
+    the modules func calls into (like 'date_parsing'), whose source is
+    part of the cache key too, since a stage that only calls one of
+    their functions doesn't change when that function does.
+    '''
+
+    def __init__(self, name, func, uses=(), **params):
+        self.name = name
+        self.func = func
+        self.uses = list(uses)
+        self.params = params
+
+    def key(self, input_hash):
+        parts = [self.name, input_hash, hash_code(self.func), repr(sorted(self.params.items()))]
+        parts += [hash_module(name) for name in self.uses]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+class Pipeline:
+    '''
+    Runs stages in order, reusing cached outputs when the input data,
+    parameters and code of a stage are unchanged.
+    '''
+
+    def __init__(self, stages, cache_dir=CACHE_DIR, max_bytes=1 << 30):
+        self.stages = stages
+        self.cache = ArtifactCache(cache_dir, max_bytes)
+        self.last_run = []
+
+    def run(self, data):
+        '''Returns the output of the last stage for the given input.'''
+        self.last_run = []
+        input_hash = hash_data(data)
+        # cached outputs are only loaded when a later stage needs them
+        value, value_key = data, None
+
+        for stage in self.stages:
+            key = stage.key(input_hash)
+            meta = self.cache.meta(key)
+            if meta is not None:
+                self.last_run.append((stage.name, 'cached'))
+                value, value_key = None, key
+                input_hash = meta['output_hash']
+                continue
+
+            if value is None:
+                value = self.cache.load(value_key)
+            value = stage.func(value, **stage.params)
+            input_hash = hash_data(value)
+            self.cache.save(key, value, {'stage': stage.name, 'output_hash': input_hash})
+            self.last_run.append((stage.name, 'computed'))
+
+        if value is None:
+            value = self.cache.load(value_key)
+        return value
+
+
+## Cleaning stages ###################################################
+# The data_cleaning.py steps applied to the employee data.
+def load_stage(path, numeric_cols=('Age', 'Salary')):
+    from numeric_coercion import read_numeric_csv
+    df, _ = read_numeric_csv(path, list(numeric_cols))
+    return df
+
+
+def dates_stage(df, col='Joining Date'):
+    from date_parsing import parse_dates
+    df = df.copy()
+    df[col], _ = parse_dates(df[col])
+    return df
+
+
+def impute_stage(df, how='bfill'):
+    from data_cleaning import impute
+    return impute(df, how)
+
+
+def scale_stage(df, col='Salary'):
+    from incremental_scaling import MinMaxScaler
+    df = df.copy()
+    values = df[col].astype('float64')
+    df[col + ' Scaled'] = MinMaxScaler().partial_fit(values).transform(values)
+    return df
+
+
+def boxcox_stage(df, col='Salary'):
+    from scipy import stats
+    df = df.copy()
+    df[col + ' Normalized'], _ = stats.boxcox(df[col].astype('float64'))
+    return df
+
+
+def employee_pipeline(cache_dir=CACHE_DIR, max_bytes=1 << 30, impute_how='bfill'):
+    '''
+    Load -> parse dates -> impute -> scale -> Box-Cox for dirty_data.csv.
+    Age and Salary are numbers after loading, so impute_how='fill'
+    can't put 'Unknown' in them, use 'bfill' or one of the drops.
+    '''
+    return Pipeline([
+        Stage('load', load_stage, uses=['numeric_coercion', 'chunking']),
+        Stage('dates', dates_stage, uses=['date_parsing']),
+        Stage('impute', impute_stage, uses=['data_cleaning'], how=impute_how),
+        Stage('scale', scale_stage, uses=['incremental_scaling']),
+        Stage('boxcox', boxcox_stage),
+    ], cache_dir, max_bytes)
@@ -0,0 +1,106 @@
+# Read a csv once, then serve it from a columnar copy.
+# The first read_csv_cached() of a file parses the csv and writes an
+# uncompressed Arrow (feather v2) copy of the DataFrame. Later reads
+# memory-map that copy instead of parsing again, and with
+# zero_copy=True the columns point straight at the mapped file. The
+# copy is rebuilt when the csv changes (checked by size + mtime, and
+# by a content hash when those differ) or different read_csv
+# arguments are used.
+#
+# Usage:
+#   salaries = read_csv_cached('csv_files/sample_pandas_data.csv')
+#   salaries = read_csv_cached('csv_files/sample_pandas_data.csv', index_col=0)
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from cleaning_pipeline import hash_data
+
+CACHE_DIR = '.csv_cache'
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError: # pyarrow is optional, without it csvs are just parsed
+    pa = None
+
+
+def _cache_paths(path, read_kwargs, cache_dir):
+    # different read_csv arguments give different frames, so they
+    # are part of the cache file name
+    args = hashlib.sha256(repr(sorted(read_kwargs.items())).encode()).hexdigest()[:12]
+    abs_path = os.path.abspath(path)
+    where = hashlib.sha256(abs_path.encode()).hexdigest()[:12]
+    name = '{}.{}.{}'.format(os.path.basename(path), where, args)
+    base = os.path.join(cache_dir, name)
+    return base + '.arrow', base + '.json'
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_fresh(path, meta_path):
+    '''
+    True when the cached copy was made from the current csv. The size
+    and mtime are checked first; the csv is only hashed when they
+    changed, so touching a file doesn't force a rebuild.
+    '''
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    stat = _source_stat(path)
+    if stat == meta['stat']:
+        return True
+    if stat['size'] != meta['stat']['size'] or hash_data(path) != meta['sha256']:
+        return False
+
+    # same contents, remember the new mtime so it isn't hashed again
+    meta['stat'] = stat
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return True
+
+
+def build_cache(path, cache_dir=CACHE_DIR, **read_kwargs):
+    '''Parses the csv and writes its columnar copy. Returns the DataFrame.'''
+    arrow_path, meta_path = _cache_paths(path, read_kwargs, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stat = _source_stat(path)
+    df = pd.read_csv(path, **read_kwargs)
+    tmp = arrow_path + '.tmp'
+    feather.write_feather(pa.Table.from_pandas(df), tmp, compression='uncompressed')
+    os.replace(tmp, arrow_path)
+    with open(meta_path, 'w') as f:
+        json.dump({'source': os.path.abspath(path), 'stat': stat, 'sha256': hash_data(path)}, f)
+    return df
+
+
+def read_csv_cached(path, cache_dir=CACHE_DIR, zero_copy=True, **read_kwargs):
+    '''
+    Same as pd.read_csv(path, **read_kwargs) but parses the csv only
+    the first time (or after it changes).
+
+    With zero_copy=True columns use pyarrow-backed dtypes (like
+    int64[pyarrow]) that read straight from the memory-mapped file.
+    zero_copy=False gives the usual numpy dtypes, which costs a copy.
+    '''
+    if pa is None:
+        return pd.read_csv(path, **read_kwargs)
+
+    arrow_path, meta_path = _cache_paths(path, read_kwargs, cache_dir)
+    if not (os.path.exists(arrow_path) and is_fresh(path, meta_path)):
+        df = build_cache(path, cache_dir, **read_kwargs)
+        if not zero_copy:
+            return df
+
+    table = feather.read_table(arrow_path, memory_map=True)
+    if zero_copy:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas()
@@ -1,64 +1,136 @@
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy import stats # for Box-Cox tranformation
-from mlxtend.preprocessing import minmax_scaling
-import datetime
+# Run 'python3 data_cleaning.py' to run every section, or pick some:
+#   python3 data_cleaning.py missing impute --impute-how bfill
+#   python3 data_cleaning.py scale normalize --no-plots
+#   python3 data_cleaning.py --bench-imports
+# Time and memory per section (any of the notes scripts works):
+#   python3 section_profiler.py data_cleaning.py -- --no-plots
+# Each section is a function so it can also be imported and used on
+# its own. Heavy libraries (pandas, seaborn, scipy, ...) are imported
+# inside the functions that use them, so importing this file is
+# instant and a step only pays for the libraries it needs.
+import argparse
+import os
+import subprocess
+import sys
 
-# set seed for reproducibility
-np.random.seed(0)
+DATA_PATH = 'csv_files/dirty_data.csv'
 
-# read in employee data
-df = pd.read_csv('csv_files/dirty_data.csv')
+# libraries each step imports (used by the import benchmark)
+STEP_IMPORTS = {
+    'missing': ['pandas', 'numpy'],
+    'impute': ['pandas'],
+    'scale': ['numpy', 'mlxtend.preprocessing'],
+    'normalize': ['numpy', 'scipy.stats'],
+    'dates': ['pandas'],
+    'plots': ['seaborn', 'matplotlib.pyplot'],
+}
+
+
+def load_data(path=DATA_PATH):
+    '''Reads in the employee data.'''
+    import pandas as pd
+    return pd.read_csv(path)
+
+# Salary is stored as strings like "60,000" and 50K, so it isn't
+# loaded as a number. numeric_coercion.py converts it while reading
+# and reports cells it couldn't convert (like Age 'Thirty'):
+# from numeric_coercion import read_numeric_csv
+# df, bad_cells = read_numeric_csv('csv_files/dirty_data.csv', ['Age', 'Salary'])
+# validating_reader.py goes further: it checks every column while
+# reading and lists each problem cell (missing, 'Thirty', "60,000",
+# 2020/04/25 among 2022-01-15s, ...) in one pass:
+# from validating_reader import read_validated
+# df, report = read_validated('csv_files/dirty_data.csv')
 
 ## Missing Values ################################################
-# get number of missing values per col
-missing_counts = df.isnull().sum()
+def find_missing(df):
+    '''
+    Returns a tuple of the missing values per col, total cells,
+    total missing and percent missing.
+    '''
+    import numpy as np
 
-# get percent of missing data
-total_cells = np.product(df.shape) # 300
-total_missing = missing_counts.sum() # 47
-percent_missing = (total_missing/total_cells)*100 # 15.666
+    # get number of missing values per col
+    missing_counts = df.isnull().sum()
+
+    # get percent of missing data
+    total_cells = np.prod(df.shape) # 300
+    total_missing = missing_counts.sum() # 47
+    percent_missing = (total_missing/total_cells)*100 # 15.666
+    return missing_counts, total_cells, total_missing, percent_missing
+
+# Files too big for memory can be profiled a chunk at a time
+# (missing_values.py gives the same numbers as above):
+# from missing_values import profile_missing
+# profile_missing('csv_files/dirty_data.csv', workers=4).percent_missing
 
 # Imputation: is determining if data is missing because it doesn't
 # exist or is not recorded. Data that doesn't exist (e.g. the
 # height of first-born child to a man without children) could
 # potentially be left as NaN, while not recorded data could possibly
 # be guessed. Look at the dataset to determine what to do.
+IMPUTE_METHODS = ['drop_rows', 'drop_cols', 'fill', 'bfill']
+
+def impute(df, how='fill'):
+    '''Returns a copy of df with missing values handled one of IMPUTE_METHODS.'''
+    # Dropping rows/cols is a quick & dirty way to handle this.
+    # (Note: this probably shouldn't be done on important projects)
+    if how == 'drop_rows':
+        return df.dropna() # removes rows with NaN values
+    if how == 'drop_cols':
+        return df.dropna(axis=1) # removes cols with NaN values
 
-# Dropping rows/cols is a quick & dirty way to handle this.
-# (Note: this probably shouldn't be done on important projects)
-df.dropna() # removes rows with NaN values
-df.dropna(axis=1) # removes cols with NaN values
+    # Replace all missing values
+    if how == 'fill':
+        return df.fillna('Unknown')
 
-# Replace all missing values
-df.fillna('Unknown')
+    # Backfill missing values (copy next value) then replace.
+    # This may not make sense to do for all datasets (like this one).
+    # axis=0 (default) copies across rows (downwards), 1 is across cols.
+    if how == 'bfill':
+        return df.bfill().fillna('Unknown')
 
-# Backfill missing values (copy next value) then replace.
-# This may not make sense to do for all datasets (like this one).
-# axis=0 (default) copies across rows (downwards), 1 is across cols.
-df.bfill().fillna('Unknown')
+    raise ValueError('how must be one of {}'.format(IMPUTE_METHODS))
 
 ## Scaling ###########################################################
 # Transorm data so that it fits within a certain range/scale.
 # such as 0-1 or 0-100. This helps compare variables equally. For
 # example, scaling Yen and USD (1 yen is worth less than 1 USD).
 # Or scaling height and weight.
+def example_data(seed=0):
+    '''Generates 1000 random points from an exponential distribution.'''
+    import numpy as np
 
-# generate 1000 random points from exponential distribution
-data = np.random.exponential(size=1000)
+    # set seed for reproducibility
+    np.random.seed(seed)
+    return np.random.exponential(size=1000)
 
-# min-max scale the data between 0 and 1
-scaled_data = minmax_scaling(data, columns=[0])
+def scale(data):
+    '''Min-max scales the data between 0 and 1.'''
+    from mlxtend.preprocessing import minmax_scaling
+    return minmax_scaling(data, columns=[0])
 
-# plot both together
-fig, ax = plt.subplots(1, 2, figsize=(15,3)) # 1 row, 2 cols, size inch
-sns.histplot(data, ax=ax[0], kde=True, legend=False)
-ax[0].set_title('Original Data')
-sns.histplot(scaled_data, ax=ax[1], kde=True, legend=False)
-ax[1].set_title('Scaled Data')
-plt.savefig('plots/scaled.png') # The scaled data retains its shape
+# For data that doesn't fit in memory, incremental_scaling.py learns
+# the min/max from chunks and then scales one chunk at a time:
+# from incremental_scaling import fit_minmax
+# scaler = fit_minmax(np.array_split(data, 10))
+# scaler.transform(data) # same values as scaled_data
+
+def plot_pair(data, changed_data, title, path):
+    '''Plots the original and changed data side by side.'''
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots(1, 2, figsize=(15,3)) # 1 row, 2 cols, size inch
+    sns.histplot(data, ax=ax[0], kde=True, legend=False)
+    ax[0].set_title('Original Data')
+    sns.histplot(changed_data, ax=ax[1], kde=True, legend=False)
+    ax[1].set_title(title)
+    plt.savefig(path)
+    plt.close(fig)
+
+# The scaled data retains its shape:
+# plot_pair(data, scaled_data, 'Scaled Data', 'plots/scaled.png')
 
 ## Normalization #####################################################
 # Change data so it can be described as a normal distribution.
@@ -66,45 +138,163 @@ plt.savefig('plots/scaled.png') # The scaled data retains its shape
 # Normal (Guassian) Distribution: Roughly equal amount of observations
 # fall above and below the mean. The mean and median are equal.
 # Also called a bell curve.
+def normalize(data):
+    '''
+    Normalizes data using boxcox.
+    (Note: this produces a tuple when input is multidimensional where
+       result[0] is the transformed data and result[1] is lambda value)
+    '''
+    from scipy import stats # for Box-Cox tranformation
+    return stats.boxcox(data)
+
+# incremental_scaling.py can also find lambda from chunks, refining
+# a grid of candidate lambdas with each pass over the data:
+# from incremental_scaling import BoxCoxTransformer
+# boxcox = BoxCoxTransformer().fit(np.array_split(data, 10))
+# boxcox.lmbda # same as normalized_data[1]
+
+# A table with many skewed columns can be normalized in one go, each
+# column with its own lambda (kept in a cache so unchanged columns
+# aren't refitted). yeo-johnson also takes zero and negative values:
+# from power_transform import PowerTransformer
+# transformer = PowerTransformer('yeo-johnson', cache_path='lambdas.json', workers=4)
+# normalized = transformer.fit_transform(df[numeric_cols])
+# transformer.transform(new_rows) # same lambdas, no refitting
 
-# normalize data from prev section using boxcox.
-# (Note: this produces a tuple when input is multidimensional where
-#    result[0] is the transformed data and result[1] is lambda value)
-normalized_data = stats.boxcox(data)
+# The shape of the data changed:
+# plot_pair(data, normalized_data[0], 'Normalized Data', 'plots/normalized.png')
 
-# plot both together
-fig, ax = plt.subplots(1, 2, figsize=(15,3)) # 1 row, 2 cols, size inch
-sns.histplot(data, ax=ax[0], kde=True, legend=False)
-ax[0].set_title('Original Data')
-sns.histplot(normalized_data, ax=ax[1], kde=True, legend=False)
-ax[1].set_title('Normalized Data')
-plt.savefig('plots/normalized.png') # The shape of the data changed
+# histplot's KDE gets slow with millions of points. binned_plots.py
+# draws the same kind of figure from a binned summary of the data
+# (made in one pass over chunks) and can render figures in parallel:
+# from binned_plots import summarize, render_figures
+# original = summarize(np.array_split(data, 10))
+# normalized = summarize([normalized_data[0]])
+# render_figures([('plots/normalized.png',
+#     [(original, 'Original Data'), (normalized, 'Normalized Data')])])
 
 ## Parsing Dates ####################################################
-df['Joining Date'].dtype # dtype('O') due to strings
-df['Joining Date'].head() # dtype: object (same as above)
+def parse_joining_dates(df):
+    '''Returns the Joining Date col as datetime64.'''
+    import pandas as pd
+
+    df['Joining Date'].dtype # dtype('O') due to strings
+    df['Joining Date'].head() # dtype: object (same as above)
+
+    # These can be converted to dates using "strftime directive".
+    # This allows specifying a date format using different identifiers.
+    # Commonly %d for day, %m for month, %y (2-digit) %Y (4-digit) year.
+    # https://strftime.org/
+
+    # A single string has a dtype of Timestamp (enhanced vers. of datetime)
+    pd.to_datetime(df['Joining Date'].iloc[0], format='%Y/%m/%d')
+
+    # A list returns a dtype of datetime64
+    pd.to_datetime(df['Joining Date'].iloc[4:7], format='%Y-%m-%d')
+
+    # Can be applied to a whole column of the dataframe. In this case,
+    # the formats are mixed. Using format='mixed' can resolve this but
+    # is potentially risky. The output also has a dtype of datetime64.
+    # Doing this is also much slower than specifying the exact format.
+    parsed_dates = pd.to_datetime(df['Joining Date'], format='mixed')
+
+    # date_parsing.py groups the strings by shape and parses each group
+    # with one exact format instead, which is much closer to the speed
+    # of a single format. Strings with an unknown shape are returned.
+    # from date_parsing import parse_dates
+    # parsed_dates, unparsed = parse_dates(df['Joining Date'])
+
+    # Again, selecting a single value returns a timestamp data type
+    t_stamp = parsed_dates.iloc[0]
+
+    # Selecting parts of a datetime (use dir to see other options):
+    parsed_dates.dt.day # return days as float64
+    parsed_dates.dt.day_of_week
+    t_stamp.day # different for timestamp obj, returns int
+    return parsed_dates
+
+## Command Line ######################################################
+STEPS = ['missing', 'impute', 'scale', 'normalize', 'dates']
+
+def run(steps=STEPS, path=DATA_PATH, impute_how='fill', plots=True):
+    '''Runs the chosen steps in order and prints a line for each.'''
+    df = load_data(path) if {'missing', 'impute', 'dates'} & set(steps) else None
+    data = example_data() if {'scale', 'normalize'} & set(steps) else None
+
+    if 'missing' in steps:
+        _, total_cells, total_missing, percent_missing = find_missing(df)
+        print('missing: {} of {} cells ({:.3f}%)'.format(
+            total_missing, total_cells, percent_missing))
+    if 'impute' in steps:
+        imputed = impute(df, impute_how)
+        print('impute ({}): {} rows, {} cols, {} missing left'.format(
+            impute_how, *imputed.shape, imputed.isnull().sum().sum()))
+    if 'scale' in steps:
+        scaled_data = scale(data)
+        print('scale: {:.3f} to {:.3f}'.format(scaled_data.min(), scaled_data.max()))
+        if plots:
+            plot_pair(data, scaled_data, 'Scaled Data', 'plots/scaled.png')
+    if 'normalize' in steps:
+        normalized_data, lmbda = normalize(data)
+        print('normalize: lambda = {:.4f}'.format(lmbda))
+        if plots:
+            plot_pair(data, normalized_data, 'Normalized Data', 'plots/normalized.png')
+    if 'dates' in steps:
+        parsed_dates = parse_joining_dates(df)
+        print('dates: {} parsed, {} missing'.format(
+            parsed_dates.notnull().sum(), parsed_dates.isnull().sum()))
 
-# These can be converted to dates using "strftime directive".
-# This allows specifying a date format using different identifiers.
-# Commonly %d for day, %m for month, %y (2-digit) %Y (4-digit) year.
-# https://strftime.org/
+## Import Benchmark ##################################################
+def bench_imports(repeat=3):
+    '''
+    Times 'import data_cleaning' and the libraries of each step in a
+    fresh interpreter (best of repeat runs), so slow startup shows up.
+    Returns a dict of step -> seconds.
+    '''
+    timer = (
+        'import time; t = time.perf_counter(); '
+        'import importlib; import data_cleaning; '
+        '[importlib.import_module(m) for m in data_cleaning.STEP_IMPORTS.get({!r}, [])]; '
+        'print(time.perf_counter() - t)'
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for step in ['data_cleaning'] + list(STEP_IMPORTS):
+        runs = [
+            float(subprocess.check_output(
+                [sys.executable, '-c', timer.format(step)], cwd=here))
+            for _ in range(repeat)
+        ]
+        times[step] = min(runs)
+    return times
 
-# A single string has a dtype of Timestamp (enhanced vers. of datetime)
-pd.to_datetime(df['Joining Date'].iloc[0], format='%Y/%m/%d')
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Data cleaning notes.')
+    parser.add_argument(
+        'steps', nargs='*',
+        help='steps to run, any of {} (default: all of them)'.format(', '.join(STEPS)),
+    )
+    parser.add_argument('--path', default=DATA_PATH, help='csv file to clean')
+    parser.add_argument('--impute-how', choices=IMPUTE_METHODS, default='fill')
+    parser.add_argument('--no-plots', action='store_true', help="don't save plots")
+    parser.add_argument(
+        '--bench-imports', action='store_true',
+        help='time how long each step takes to import its libraries',
+    )
+    args = parser.parse_args(argv)
 
-# A list returns a dtype of datetime64
-pd.to_datetime(df['Joining Date'].iloc[4:7], format='%Y-%m-%d')
+    if args.bench_imports:
+        for step, seconds in bench_imports().items():
+            print('{:<15} {:8.1f} ms'.format(step, seconds * 1000))
+        return
 
-# Can be applied to a whole column of the dataframe. In this case,
-# the formats are mixed. Using format='mixed' can resolve this but
-# is potentially risky. The output also has a dtype of datetime64.
-# Doing this is also much slower than specifying the exact format.
-parsed_dates = pd.to_datetime(df['Joining Date'], format='mixed')
+    unknown = set(args.steps) - set(STEPS)
+    if unknown:
+        parser.error('unknown steps: {}'.format(', '.join(sorted(unknown))))
 
-# Again, selecting a single value returns a timestamp data type
-t_stamp = parsed_dates.iloc[0]
+    # keep the order steps are listed in STEPS
+    steps = [step for step in STEPS if step in args.steps or not args.steps]
+    run(steps, args.path, args.impute_how, plots=not args.no_plots)
 
-# Selecting parts of a datetime (use dir to see other options):
-parsed_dates.dt.day # return days as float64
-parsed_dates.dt.day_of_week
-t_stamp.day # different for timestamp obj, returns int
+if __name__ == '__main__':
+    main()
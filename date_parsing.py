@@ -0,0 +1,89 @@
+# Faster alternative to pd.to_datetime(col, format='mixed').
+# 'mixed' guesses the format of every single element. Most columns
+# only use a handful of formats, so instead each string is classified
+# by its shape (digits -> 9, words -> a) and every shape is parsed
+# with one exact strftime format in a single vectorized call.
+# Repeated strings are only parsed once.
+#
+# Usage:
+#   parsed, unparsed = parse_dates(df['Joining Date'])
+#   unparsed # rows that had a value but no known format
+import numpy as np
+import pandas as pd
+
+# shape of the string -> strftime format used for it
+# (ambiguous shapes like 99-99-9999 are month first, like
+# format='mixed', pass your own formats dict to parse_dates to change that)
+SHAPE_FORMATS = {
+    '9999-99-99': '%Y-%m-%d', # 2022-01-15
+    '9999/99/99': '%Y/%m/%d', # 2020/04/25
+    '99-99-9999': '%m-%d-%Y', # 11-12-2018
+    '99/99/9999': '%m/%d/%Y', # 11/12/2018
+    '99.99.9999': '%m.%d.%Y', # 11.12.2018
+    'a 99, 9999': '%B %d, %Y', # March 10, 2020
+    'a 9, 9999': '%B %d, %Y', # March 1, 2020
+    '99 a 9999': '%d %B %Y', # 10 March 2020
+    '9999-99-99 99:99:99': '%Y-%m-%d %H:%M:%S',
+}
+
+# month first formats -> the day first one tried for dates that don't
+# fit them (15-02-2021 has no month 15), as format='mixed' does
+DAY_FIRST = {
+    '%m-%d-%Y': '%d-%m-%Y',
+    '%m/%d/%Y': '%d/%m/%Y',
+    '%m.%d.%Y': '%d.%m.%Y',
+}
+
+
+def date_shapes(strings):
+    '''
+    Returns the shape of each string in a Series of strings.
+
+    >>> date_shapes(pd.Series(['2020/04/25', 'March 10, 2020'])).tolist()
+    ['9999/99/99', 'a 99, 9999']
+    '''
+    return (
+        strings.str.strip()
+        .str.replace(r'\d', '9', regex=True)
+        .str.replace(r'[^\W\d_]+', 'a', regex=True)
+    )
+
+
+def parse_dates(col, formats=None):
+    '''
+    Parses a column of date strings that use several formats.
+
+    Returns a tuple where result[0] is the parsed datetime64 Series
+    (same index as col) and result[1] is a Series of the original
+    values that could not be parsed (missing values aren't included).
+    formats maps shapes to strftime formats, see SHAPE_FORMATS.
+    '''
+    formats = SHAPE_FORMATS if formats is None else formats
+
+    # parse each unique string only once, codes maps rows back to them
+    codes, uniques = pd.factorize(col)
+    if not len(uniques): # nothing but missing values
+        return pd.Series(pd.NaT, index=col.index, name=col.name, dtype='datetime64[ns]'), col[:0]
+    uniques = pd.Series(uniques, dtype='object').astype('str')
+    parsed_uniques = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    shapes = date_shapes(uniques)
+    for shape, group in uniques.groupby(shapes, sort=False):
+        fmt = formats.get(shape)
+        if fmt is None:
+            continue # left as NaT and reported below
+        parsed_uniques[group.index] = pd.to_datetime(
+            group.str.strip(), format=fmt, errors='coerce'
+        )
+        if fmt in DAY_FIRST:
+            failed = group[parsed_uniques[group.index].isnull()]
+            parsed_uniques[failed.index] = pd.to_datetime(
+                failed.str.strip(), format=DAY_FIRST[fmt], errors='coerce'
+            )
+
+    # factorize gives missing values the code -1
+    values = parsed_uniques.to_numpy().take(codes)
+    values[codes == -1] = np.datetime64('NaT')
+    parsed = pd.Series(values, index=col.index, name=col.name)
+    unparsed = col[parsed.isnull() & col.notnull()]
+    return parsed, unparsed
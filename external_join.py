@@ -0,0 +1,263 @@
+# concat and join for csv files bigger than memory.
+# The Combining section of learn_pandas.py reads CAvideos.csv and
+# GBvideos.csv whole and calls pd.concat / DataFrame.join. Here the
+# files are only ever read a chunk at a time:
+#   concat_csv - streams each file's chunks to the output, lining up
+#                columns (ones a file doesn't have are left blank)
+#   join_csv   - hash-partitions both files on the join keys into
+#                pickled pieces on disk (rows with the same key always
+#                land in the same partition), then joins one pair of
+#                partitions at a time with DataFrame.join and appends
+#                the result to the output csv
+# The number of partitions and the chunk size are picked from
+# memory_limit so a partition pair plus its join fits under it. A
+# partition that still comes out too big (a very common key) is split
+# again with a different hash. Each file's key columns get one dtype
+# first (a pass over just those), since chunks can infer different
+# ones and the hash depends on it. memory_limit counts the data pandas
+# and numpy hold (what tracemalloc sees); the process itself is bigger
+# by the interpreter and the allocator's unreturned pages.
+#
+# Usage:
+#   concat_csv(['CAvideos.csv', 'GBvideos.csv'], 'videos.csv')
+#   join_csv('CAvideos.csv', 'GBvideos.csv', ['title', 'trending_date'],
+#            'joined.csv', lsuffix='_CAN', rsuffix='_UK', memory_limit=512 * 2**20)
+# The joined rows come out grouped by partition, not in file order.
+import math
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from chunking import iter_csv_chunks
+
+MEMORY_LIMIT = 256 * 2**20
+SAMPLE_ROWS = 1000
+# a partition pair, the joined result and pandas' temporaries
+JOIN_OVERHEAD = 5
+# share of the limit for one chunk read from a csv: hashing string
+# keys makes python objects of them, which takes about 5x the chunk
+CHUNK_SHARE = .1
+MAX_DEPTH = 4
+# partitions written at once (one open file each); bigger inputs get
+# split again at the next depth
+MAX_FANOUT = 256
+
+
+## Sizing ############################################################
+def _row_sizes(path, **read_kwargs):
+    '''(bytes per row in the file, bytes per row in memory), from a sample.'''
+    sample = pd.read_csv(path, nrows=SAMPLE_ROWS, **read_kwargs)
+    if sample.empty:
+        return 1, 1
+    with open(path, 'rb') as f:
+        lines = [f.readline() for _ in range(len(sample) + 1)]
+    file_bytes = sum(map(len, lines[1:])) / len(sample)
+    memory_bytes = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    return max(file_bytes, 1), max(memory_bytes, 1)
+
+
+def estimate_memory(path, **read_kwargs):
+    '''Roughly how many bytes the whole csv takes once loaded.'''
+    file_bytes, memory_bytes = _row_sizes(path, **read_kwargs)
+    return os.path.getsize(path) / file_bytes * memory_bytes
+
+
+def chunk_rows(path, memory_limit, share=CHUNK_SHARE, **read_kwargs):
+    '''Rows per chunk so one chunk uses at most share of memory_limit.'''
+    _, memory_bytes = _row_sizes(path, **read_kwargs)
+    return max(1, int(memory_limit * share / memory_bytes))
+
+
+## Concat ############################################################
+def _header(path, **read_kwargs):
+    return list(pd.read_csv(path, nrows=0, **read_kwargs).columns)
+
+
+def _append_csv(df, out, first, index=False):
+    df.to_csv(out, mode='w' if first else 'a', header=first, index=index)
+
+
+def concat_csv(paths, out, memory_limit=MEMORY_LIMIT, **read_kwargs):
+    '''
+    Same as pd.concat([pd.read_csv(p) for p in paths]).to_csv(out,
+    index=False) without ever holding more than a chunk. Returns the
+    number of rows written.
+    '''
+    columns = []
+    for path in paths:
+        columns += [c for c in _header(path, **read_kwargs) if c not in columns]
+
+    n_rows = 0
+    for path in paths:
+        rows = chunk_rows(path, memory_limit, **read_kwargs)
+        for chunk in iter_csv_chunks(path, rows, **read_kwargs):
+            _append_csv(chunk.reindex(columns=columns), out, n_rows == 0)
+            n_rows += len(chunk)
+    if n_rows == 0:
+        pd.DataFrame(columns=columns).to_csv(out, index=False)
+    return n_rows
+
+
+## Key dtypes ########################################################
+def _common_dtype(kinds):
+    # the dtype pandas gives the whole column, from the ones its chunks got
+    if kinds <= {'i'}:
+        return 'int64'
+    if kinds <= {'i', 'f'}:
+        return 'float64'
+    if kinds == {'b'}:
+        return 'bool'
+    return 'str'
+
+
+def key_dtypes(path, by, chunksize=100_000, **read_kwargs):
+    '''
+    {column: dtype} for key columns (join or sort keys) that every
+    chunk agrees on. Each chunk of a csv infers its own dtypes (Age is
+    int in a chunk of numbers and str in one with 'Thirty'), and keys
+    of different dtypes hash and sort differently, so one pass over
+    just the key columns picks the dtype the whole column would get.
+    '''
+    fixed = read_kwargs.get('dtype')
+    if fixed is not None and not isinstance(fixed, dict):
+        return {}
+    todo = [col for col in by if col not in (fixed or {})]
+    if not todo:
+        return {}
+    kwargs = {k: v for k, v in read_kwargs.items() if k not in ('usecols', 'dtype', 'index_col')}
+    kinds = {col: set() for col in todo}
+    for chunk in iter_csv_chunks(path, chunksize, usecols=todo, **kwargs):
+        for col in todo:
+            kinds[col].add(chunk[col].dtype.kind)
+    return {col: _common_dtype(kinds[col]) for col in todo}
+
+
+def _fix_key_dtypes(path, by, chunksize, read_kwargs):
+    dtypes = key_dtypes(path, by, chunksize, **read_kwargs)
+    if not dtypes:
+        return read_kwargs
+    return dict(read_kwargs, dtype=dict(read_kwargs.get('dtype') or {}, **dtypes))
+
+
+## Partitioning ######################################################
+def _hash_key(depth):
+    # hash_pandas_object needs a 16 character key; a new one per
+    # level splits a partition differently from the level above
+    return '{:0>16}'.format(depth)
+
+
+def _canonical_keys(keys):
+    # the hash depends on the dtype, and a key column reads as float in
+    # a file or chunk with a missing key and as int elsewhere, so
+    # numbers are hashed as float64 (1 and 1.0 must land together)
+    return keys.apply(lambda col: col.astype('float64') if pd.api.types.is_numeric_dtype(col)
+                      and not pd.api.types.is_bool_dtype(col) else col)
+
+
+def _partition_of(df, on, n_parts, depth):
+    keys = _canonical_keys(df[on])
+    hashes = pd.util.hash_pandas_object(keys, index=False, hash_key=_hash_key(depth))
+    return (hashes % n_parts).to_numpy()
+
+
+def _write_partitions(chunks, on, n_parts, depth, folder, side):
+    '''Appends each chunk's rows to its partition file. Returns the paths.'''
+    paths = [os.path.join(folder, '{}-{}.pkl'.format(side, i)) for i in range(n_parts)]
+    files = [open(p, 'wb') for p in paths]
+    try:
+        for chunk in chunks:
+            part = _partition_of(chunk, on, n_parts, depth)
+            for i, piece in chunk.groupby(part, sort=False):
+                pickle.dump(piece, files[i], protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def _iter_pieces(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _read_partition(path, columns):
+    pieces = list(_iter_pieces(path))
+    if not pieces:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(pieces, ignore_index=True)
+
+
+## Join ##############################################################
+class _CsvWriter:
+    '''Appends frames to a csv, header (keys included) written once.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.started = False
+        self.n_rows = 0
+
+    def write(self, df):
+        if len(df) or not self.started:
+            _append_csv(df, self.path, not self.started, index=True)
+            self.started = True
+        self.n_rows += len(df)
+
+
+def _join_pair(left_path, right_path, on, columns, memory_limit, depth, folder, write, **join_kwargs):
+    size = os.path.getsize(left_path) + os.path.getsize(right_path)
+    if size * JOIN_OVERHEAD > memory_limit and depth < MAX_DEPTH:
+        # too big to join at once: split this pair again
+        n_parts = min(MAX_FANOUT, math.ceil(size * JOIN_OVERHEAD / memory_limit))
+        sub = tempfile.mkdtemp(dir=folder)
+        lefts = _write_partitions(_iter_pieces(left_path), on, n_parts, depth + 1, sub, 'left')
+        rights = _write_partitions(_iter_pieces(right_path), on, n_parts, depth + 1, sub, 'right')
+        os.remove(left_path)
+        os.remove(right_path)
+        for lp, rp in zip(lefts, rights):
+            _join_pair(lp, rp, on, columns, memory_limit, depth + 1, sub, write, **join_kwargs)
+        return
+
+    left = _read_partition(left_path, columns[0]).set_index(on)
+    right = _read_partition(right_path, columns[1]).set_index(on)
+    write(left.join(right, **join_kwargs))
+    os.remove(left_path)
+    os.remove(right_path)
+
+
+def join_csv(left, right, on, out, how='left', lsuffix='', rsuffix='',
+             memory_limit=MEMORY_LIMIT, tmp_dir=None, **read_kwargs):
+    '''
+    Same as
+        pd.read_csv(left).set_index(on).join(
+            pd.read_csv(right).set_index(on), how=how, lsuffix=lsuffix, rsuffix=rsuffix)
+    written to the csv out (keys first), but holding about memory_limit
+    bytes of data at most. Rows are grouped by partition rather than in the
+    order pandas gives. Returns the number of rows written.
+    '''
+    on = [on] if isinstance(on, str) else list(on)
+    columns = (_header(left, **read_kwargs), _header(right, **read_kwargs))
+    overlap = (set(columns[0]) & set(columns[1])) - set(on)
+    if overlap and not (lsuffix or rsuffix):
+        raise ValueError('columns overlap but no suffix specified: {}'.format(sorted(overlap)))
+
+    total = estimate_memory(left, **read_kwargs) + estimate_memory(right, **read_kwargs)
+    n_parts = min(MAX_FANOUT, max(1, math.ceil(total * JOIN_OVERHEAD / memory_limit)))
+    writer = _CsvWriter(out)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as folder:
+        parts = {}
+        for side, path in (('left', left), ('right', right)):
+            rows = chunk_rows(path, memory_limit, **read_kwargs)
+            # equal keys must get the same dtype (and hash) in every chunk
+            kwargs = _fix_key_dtypes(path, on, rows, read_kwargs)
+            parts[side] = _write_partitions(iter_csv_chunks(path, rows, **kwargs), on, n_parts, 0, folder, side)
+        for lp, rp in zip(parts['left'], parts['right']):
+            _join_pair(lp, rp, on, columns, memory_limit, 0, folder, writer.write,
+                       how=how, lsuffix=lsuffix, rsuffix=rsuffix)
+    return writer.n_rows
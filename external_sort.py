@@ -0,0 +1,233 @@
+# sort_values for csv files bigger than memory, and the first n rows
+# of a sort without sorting everything.
+# The Sorting section of learn_pandas.py sorts whole frames in memory.
+#   sort_csv / iter_sorted_csv - external merge sort: the csv is read
+#       a chunk at a time, each chunk is sorted and spilled to disk as
+#       a run, then the runs are merged a block at a time. At every
+#       step, everything that sorts before the last loaded row of the
+#       furthest-behind run is final and is written out. A first pass
+#       over just the sort columns gives them one dtype for the whole
+#       file, since chunks can infer different ones.
+#   top_n / bottom_n - the first n rows of sort_values. np.partition
+#       finds the n-th value of the first sort key, rows before it are
+#       kept, and only rows tied with it go on to the next key. The
+#       kept rows (about n) are the only ones that get sorted.
+#   top_n_csv - the same, a chunk at a time (keeps n rows in memory)
+# All of them are stable (ties keep file order, like
+# sort_values(kind='stable')) and keep the original index, as the
+# notes describe: row numbers in the file, or index_col if given.
+#
+# Usage:
+#   sort_csv('salaries.csv', 'sorted.csv', by=['City', 'Salary'], ascending=False)
+#   for chunk in iter_sorted_csv('salaries.csv', by='Salary'): ...
+#   top_n(salaries, 'Salary', 10) # 10 highest salaries
+#   bottom_n(salaries, ['City', 'Salary'], 5)
+#   top_n_csv('salaries.csv', 'Salary', 10)
+import math
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from chunking import iter_csv_chunks
+from external_join import MEMORY_LIMIT, _append_csv, _fix_key_dtypes, chunk_rows, estimate_memory
+
+# share of the limit for a chunk being sorted into a run (the chunk,
+# its sorted copy and pickling it)
+RUN_SHARE = .25
+# blocks per run for merging: the rows held (about 1.5 blocks per
+# run), their concat and sorted copy, and the csv writer's buffers
+MERGE_OVERHEAD = 10
+# position of each row in the file, the tie breaker that keeps sorts stable
+ROW = '__row__'
+
+
+def _as_lists(by, ascending):
+    by = [by] if isinstance(by, str) else list(by)
+    ascending = [ascending] * len(by) if isinstance(ascending, bool) else list(ascending)
+    if len(ascending) != len(by):
+        raise ValueError('ascending needs one value per sort column')
+    return by, ascending
+
+
+def _sort(df, by, ascending):
+    # by the keys, then by file position for ties
+    return df.sort_values(by + [ROW], ascending=ascending + [True], kind='stable', na_position='last')
+
+
+## Runs ##############################################################
+def _write_run(chunk, by, ascending, path, block_rows):
+    run = _sort(chunk, by, ascending)
+    with open(path, 'wb') as f:
+        for start in range(0, len(run), block_rows):
+            pickle.dump(run.iloc[start:start + block_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _iter_blocks(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _merge_runs(paths, by, ascending, block_rows):
+    '''Yields the rows of sorted runs as sorted blocks.'''
+    runs = [_iter_blocks(p) for p in paths]
+    pending = [] # loaded rows not written yet (frames)
+    last = {} # run -> its last loaded row
+    remaining = np.zeros(len(runs), dtype='int64')
+
+    def load(r):
+        block = next(runs[r], None)
+        if block is None:
+            last.pop(r, None)
+            return
+        block = block.assign(**{'__run__': r})
+        pending.append(block)
+        last[r] = block.iloc[-1:]
+        remaining[r] += len(block)
+
+    for r in range(len(runs)):
+        load(r)
+    while last:
+        merged = _sort(pd.concat(pending), by, ascending)
+        # rows a run hasn't loaded sort after its last loaded row, so
+        # everything up to the smallest of those is final
+        bound = _sort(pd.concat(last.values()), by, ascending)[ROW].iloc[0]
+        stop = np.flatnonzero(merged[ROW].to_numpy() == bound)[0] + 1
+        done, rest = merged.iloc[:stop], merged.iloc[stop:]
+        yield done.drop(columns='__run__')
+        remaining -= np.bincount(done['__run__'].to_numpy(), minlength=len(runs))
+        pending = [rest]
+        # top up the runs that are running low
+        for r in list(last):
+            if remaining[r] < block_rows / 2:
+                load(r)
+    rest = pd.concat(pending) if pending else pd.DataFrame()
+    if len(rest):
+        yield _sort(rest, by, ascending).drop(columns='__run__')
+
+
+## Sort ##############################################################
+def iter_sorted_csv(path, by, ascending=True, memory_limit=MEMORY_LIMIT, tmp_dir=None, **read_kwargs):
+    '''
+    Yields the rows of
+        pd.read_csv(path).sort_values(by, ascending=ascending, kind='stable')
+    as sorted DataFrames, holding about memory_limit bytes of data at
+    most. Missing values sort last.
+    '''
+    by, ascending = _as_lists(by, ascending)
+    rows = chunk_rows(path, memory_limit, share=RUN_SHARE, **read_kwargs)
+    n_runs = max(1, math.ceil(estimate_memory(path, **read_kwargs) / (memory_limit * RUN_SHARE)))
+    block_rows = chunk_rows(path, memory_limit, share=1 / (MERGE_OVERHEAD * n_runs), **read_kwargs)
+    read_kwargs = _fix_key_dtypes(path, by, rows, read_kwargs)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as folder:
+        paths, offset, dtypes = [], 0, None
+        for chunk in iter_csv_chunks(path, rows, **read_kwargs):
+            # runs sorted by keys of different dtypes would merge wrongly
+            if dtypes is None:
+                dtypes = chunk[by].dtypes
+            elif not chunk[by].dtypes.equals(dtypes):
+                raise ValueError('sort columns {} changed dtype between chunks; pass dtype= for them'.format(by))
+            chunk[ROW] = np.arange(offset, offset + len(chunk))
+            offset += len(chunk)
+            paths.append(os.path.join(folder, 'run-{}.pkl'.format(len(paths))))
+            _write_run(chunk, by, ascending, paths[-1], block_rows)
+        for block in _merge_runs(paths, by, ascending, block_rows):
+            yield block.drop(columns=ROW)
+
+
+def sort_csv(path, out, by, ascending=True, memory_limit=MEMORY_LIMIT, tmp_dir=None, **read_kwargs):
+    '''
+    Same as pd.read_csv(path).sort_values(by, ascending=ascending,
+    kind='stable').to_csv(out) (the index is written too), holding
+    about memory_limit bytes of data at most. Returns the number of
+    rows written.
+    '''
+    n_rows = 0
+    blocks = iter_sorted_csv(path, by, ascending, memory_limit, tmp_dir, **read_kwargs)
+    for block in blocks:
+        _append_csv(block, out, n_rows == 0, index=True)
+        n_rows += len(block)
+    if n_rows == 0:
+        pd.read_csv(path, nrows=0, **read_kwargs).to_csv(out)
+    return n_rows
+
+
+## Top n #############################################################
+def _order_keys(values, ascending):
+    '''
+    Numbers that sort values the way sort_values does (smaller first,
+    missing last). Floats get a second key so NaN comes after inf.
+    '''
+    if pd.api.types.is_numeric_dtype(values):
+        x = values.to_numpy(dtype='float64', na_value=np.nan)
+        missing = np.isnan(x)
+        x = np.where(missing, np.inf, x if ascending else -x)
+        return [x, missing.astype('float64')] if missing.any() else [x]
+    codes, uniques = pd.factorize(values, sort=True)
+    missing = codes < 0
+    codes = codes.astype('float64')
+    if not ascending:
+        codes = len(uniques) - 1 - codes
+    codes[missing] = len(uniques)
+    return [codes]
+
+
+def _first_rows(df, by, ascending, n):
+    '''Positions of the first n rows of the stable sort, in file order.'''
+    rows = np.arange(len(df))
+    kept = []
+    for col, asc in zip(by, ascending):
+        if len(rows) <= n:
+            break
+        keys = _order_keys(df[col].iloc[rows], asc)
+        left = np.arange(len(rows)) # still undecided, as positions in keys
+        for key in keys:
+            key = key[left]
+            if len(left) <= n:
+                break
+            nth = np.partition(key, n - 1)[n - 1]
+            before = key < nth
+            kept.append(rows[left[before]])
+            n -= np.count_nonzero(before)
+            # only rows tied with the n-th need the next key
+            left = left[key == nth] if n else left[:0]
+        rows = rows[left]
+    # still tied on every key: file order decides
+    kept.append(rows[:n])
+    return np.sort(np.concatenate(kept))
+
+
+def top_n(df, by, n=10, ascending=False):
+    '''
+    Same as df.sort_values(by, ascending=ascending, kind='stable').head(n)
+    without sorting the whole frame. The default gives the largest.
+    '''
+    by, ascending = _as_lists(by, ascending)
+    if n <= 0:
+        return df.iloc[:0]
+    picked = df.iloc[_first_rows(df, by, ascending, n)]
+    return picked.sort_values(by, ascending=ascending, kind='stable', na_position='last')
+
+
+def bottom_n(df, by, n=10, ascending=True):
+    '''top_n sorted the other way: the n smallest by default.'''
+    return top_n(df, by, n, ascending)
+
+
+def top_n_csv(path, by, n=10, ascending=False, chunksize=100_000, **read_kwargs):
+    '''top_n of a csv read a chunk at a time, keeping only n rows between chunks.'''
+    by, _ = _as_lists(by, ascending)
+    read_kwargs = _fix_key_dtypes(path, by, chunksize, read_kwargs)
+    best = None
+    for chunk in iter_csv_chunks(path, chunksize, **read_kwargs):
+        # best's rows come first in the file, so ties still go its way
+        chunk = top_n(chunk, by, n, ascending)
+        best = chunk if best is None else top_n(pd.concat([best, chunk]), by, n, ascending)
+    return best if best is not None else pd.read_csv(path, nrows=0, **read_kwargs)
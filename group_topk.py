@@ -0,0 +1,61 @@
+# Top rows per group without a python function per group.
+# learn_pandas.py finds the top earner of each group with
+#   salaries.groupby('Age').apply(lambda df: df.loc[df.Salary.idxmax()])
+# which calls the lambda once for every group. top_k_per_group does
+# the same with one sort: rows are ordered by (group, value, position)
+# and the first k rows of each group segment are kept. Ties keep the
+# row that comes first, like idxmax.
+#
+# Usage:
+#   top_k_per_group(salaries, 'Age', 'Salary') # same as the apply above
+#   top_k_per_group(salaries, ['Age', 'City'], 'Salary', k=3)
+#   top_k_per_group(salaries, 'City', 'Age', k=2, largest=False)
+import numpy as np
+import pandas as pd
+
+
+def top_k_per_group(df, by, col, k=1, largest=True, include_groups=False):
+    '''
+    Returns the k rows with the largest (or smallest) col in each group.
+
+    With k=1 the result is indexed by the group keys, the same as
+    groupby(by).apply(lambda df: df.loc[df[col].idxmax()]). With k > 1
+    the original index is added as the last index level, the same as
+    groupby(by).apply(lambda df: df.nlargest(k, col, keep='first')).
+    Rows where col is missing are skipped (so are groups with no
+    values). The grouping cols are left out unless include_groups.
+    '''
+    keys = [by] if isinstance(by, str) else list(by)
+    if k < 1:
+        raise ValueError('k must be at least 1')
+
+    # group number of each row (groups sorted by key like groupby)
+    codes = df.groupby(keys, sort=True, dropna=True).ngroup().to_numpy()
+    values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+    usable = (codes >= 0) & ~np.isnan(values)
+    rows = np.flatnonzero(usable)
+    codes, values = codes[usable].astype('int64'), values[usable]
+
+    # lexsort uses the last key first: group, then value (largest
+    # first unless largest=False), then position to keep ties stable
+    order = np.lexsort((rows, -values if largest else values, codes))
+    codes_sorted = codes[order]
+
+    # position of each row within its group segment
+    starts = np.flatnonzero(np.diff(codes_sorted, prepend=-1))
+    segment_start = np.repeat(starts, np.diff(np.r_[starts, len(codes_sorted)]))
+    rank = np.arange(len(codes_sorted)) - segment_start
+    picked = rows[order[rank < k]]
+
+    result = df.iloc[picked]
+    group_index = pd.MultiIndex.from_frame(result[keys]) if len(keys) > 1 else pd.Index(result[keys[0]])
+    if k == 1:
+        result = result.set_axis(group_index, axis=0)
+    else:
+        levels = [group_index.get_level_values(i) for i in range(group_index.nlevels)]
+        result = result.set_axis(
+            pd.MultiIndex.from_arrays(levels + [result.index]), axis=0
+        )
+    if not include_groups:
+        result = result.drop(columns=keys)
+    return result
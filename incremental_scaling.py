@@ -0,0 +1,226 @@
+# Out-of-core versions of the 'Scaling' and 'Normalization' sections
+# of data_cleaning.py. Both learn what they need from a stream of
+# chunks with partial_fit(), can be merged with statistics fitted in
+# other processes, and transform chunks one at a time afterwards.
+#
+# Usage:
+#   scaler = MinMaxScaler()
+#   for chunk in chunks:
+#       scaler.partial_fit(chunk)
+#   scaled_chunks = scaler.transform_chunks(chunks) # lazy generator
+#
+#   lmbda = fit_boxcox(list_of_chunks, workers=4)
+#   normalized = special.boxcox(chunk, lmbda)
+from functools import partial
+
+import numpy as np
+from scipy import special
+
+from chunking import bounded_map
+
+
+def as_1d(chunk):
+    '''A chunk (array, Series, list, ...) as a flat float64 array.'''
+    return np.asarray(chunk, dtype='float64').ravel()
+
+
+def iter_chunks(source):
+    '''
+    Iterates over the chunks of source: a callable (like a function
+    that reopens a file) or anything that can be iterated over more
+    than once, like a list.
+    '''
+    return source() if callable(source) else iter(source)
+
+
+## Min-max scaling ###################################################
+class MinMaxScaler:
+    '''
+    Min-max scales data into [min_val, max_val] (default 0-1).
+    Gives the same result as mlxtend's minmax_scaling.
+    '''
+
+    def __init__(self, min_val=0, max_val=1):
+        self.min_val = min_val
+        self.max_val = max_val
+        self.data_min = np.inf
+        self.data_max = -np.inf
+        self.n = 0
+
+    def partial_fit(self, chunk):
+        # missing values are skipped (a NaN would make min and max NaN)
+        x = as_1d(chunk)
+        x = x[~np.isnan(x)]
+        if len(x):
+            self.data_min = min(self.data_min, x.min())
+            self.data_max = max(self.data_max, x.max())
+            self.n += len(x)
+        return self
+
+    def merge(self, other):
+        self.data_min = min(self.data_min, other.data_min)
+        self.data_max = max(self.data_max, other.data_max)
+        self.n += other.n
+        return self
+
+    def transform(self, chunk):
+        if self.n == 0:
+            raise ValueError('MinMaxScaler has not been fitted yet')
+        x = as_1d(chunk)
+        # a constant column would be 0/0, scale it to 0 like mlxtend
+        spread = (self.data_max - self.data_min) or 1
+        scaled = (x - self.data_min) / spread
+        return scaled * (self.max_val - self.min_val) + self.min_val
+
+    def transform_chunks(self, chunks):
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+
+def fit_minmax(source, workers=1, **scaler_kwargs):
+    '''Fits a MinMaxScaler on chunks, using several processes if asked.'''
+    fit_chunk = partial(_fit_minmax_chunk, scaler_kwargs)
+    scaler = MinMaxScaler(**scaler_kwargs)
+    for part in bounded_map(fit_chunk, iter_chunks(source), workers):
+        scaler.merge(part)
+    return scaler
+
+
+def _fit_minmax_chunk(scaler_kwargs, chunk):
+    return MinMaxScaler(**scaler_kwargs).partial_fit(chunk)
+
+
+## Box-Cox ###########################################################
+# scipy picks lambda by maximizing the Box-Cox log-likelihood
+#   llf(lmb) = (lmb - 1) * sum(log(x)) - n/2 * log(var(boxcox(x, lmb)))
+# which needs all the data for every guess of lambda. Instead the
+# mean and variance of boxcox(x, lmb) are collected for a whole grid
+# of lambdas in one pass. Those can be merged between chunks (Chan's
+# parallel variance formula), the best grid point is picked, and then
+# a finer grid around it is used on the next pass.
+# power_transform.py fits many columns in memory with the same two
+# helpers.
+def llf_from_stats(lmbda, log_term, n, var):
+    '''
+    The log-likelihood above from its pieces: log_term is sum(log(x))
+    (Yeo-Johnson uses its own), var the variance of the transformed
+    data. Works elementwise, for a grid or for many columns.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (lmbda - 1) * log_term - n / 2 * np.log(var)
+
+
+def bracket_peak(grid, llf):
+    '''
+    (lo, hi) around the best lambda, given llf evaluated on grid (one
+    row per grid point, a column per series when 2d): one step either
+    side of the best grid point, or the width of the whole grid
+    centred on it when it is at the edge (the peak may be further out).
+    '''
+    best = np.argmax(np.nan_to_num(llf, nan=-np.inf), axis=0)
+    edge = (best == 0) | (best == len(grid) - 1)
+    step = np.where(edge, (grid[-1] - grid[0]) / 2, grid[1] - grid[0])
+    return grid[best] - step, grid[best] + step
+
+
+class BoxCoxFitter:
+    '''Box-Cox log-likelihood over a grid of lambdas, fitted in chunks.'''
+
+    def __init__(self, grid):
+        self.grid = np.asarray(grid, dtype='float64')
+        self.n = 0
+        self.log_sum = 0.0
+        self.mean = np.zeros(len(self.grid))
+        self.m2 = np.zeros(len(self.grid)) # sum of squared deviations
+
+    def partial_fit(self, chunk):
+        x = as_1d(chunk)
+        if len(x) == 0:
+            return self
+        if np.any(x <= 0):
+            raise ValueError('Data must be positive.')
+
+        mean = np.empty(len(self.grid))
+        m2 = np.empty(len(self.grid))
+        for i, lmb in enumerate(self.grid):
+            y = special.boxcox(x, lmb)
+            mean[i] = y.mean()
+            m2[i] = ((y - mean[i])**2).sum()
+
+        other = BoxCoxFitter(self.grid)
+        other.n, other.log_sum = len(x), np.log(x).sum()
+        other.mean, other.m2 = mean, m2
+        return self.merge(other)
+
+    def merge(self, other):
+        if not np.array_equal(self.grid, other.grid):
+            raise ValueError('can only merge fitters with the same grid')
+        n = self.n + other.n
+        if other.n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.log_sum += other.log_sum
+        return self
+
+    def llf(self):
+        '''Log-likelihood of every lambda in the grid.'''
+        return llf_from_stats(self.grid, self.log_sum, self.n, self.m2 / self.n)
+
+    @property
+    def lmbda(self):
+        '''The grid lambda with the highest log-likelihood.'''
+        return self.grid[np.nanargmax(self.llf())]
+
+    def next_grid(self):
+        '''
+        A grid spanning one step either side of the current best
+        lambda, or the same grid shifted out when the best lambda is
+        at its edge.
+        '''
+        return np.linspace(*bracket_peak(self.grid, self.llf()), len(self.grid))
+
+
+def fit_boxcox(source, workers=1, passes=5, grid_size=201, lmbda_range=(-2, 2)):
+    '''
+    Finds the Box-Cox lambda of data given as chunks, matching
+    scipy.stats.boxcox to floating-point tolerance.
+
+    source must be re-iterable (a list of chunks or a function
+    returning an iterator of chunks) since every pass reads all the
+    data. Each pass narrows the lambda grid by about 100x.
+    '''
+    grid = np.linspace(*lmbda_range, grid_size)
+    for _ in range(passes):
+        fit_chunk = partial(_fit_boxcox_chunk, grid)
+        fitter = BoxCoxFitter(grid)
+        for part in bounded_map(fit_chunk, iter_chunks(source), workers):
+            fitter.merge(part)
+        grid = fitter.next_grid()
+    return fitter.lmbda
+
+
+def _fit_boxcox_chunk(grid, chunk):
+    return BoxCoxFitter(grid).partial_fit(chunk)
+
+
+class BoxCoxTransformer:
+    '''Applies a fitted Box-Cox lambda to chunks.'''
+
+    def __init__(self, lmbda=None):
+        self.lmbda = lmbda
+
+    def fit(self, source, workers=1, **fit_kwargs):
+        self.lmbda = fit_boxcox(source, workers, **fit_kwargs)
+        return self
+
+    def transform(self, chunk):
+        if self.lmbda is None:
+            raise ValueError('BoxCoxTransformer has not been fitted yet')
+        return special.boxcox(as_1d(chunk), self.lmbda)
+
+    def transform_chunks(self, chunks):
+        for chunk in chunks:
+            yield self.transform(chunk)
@@ -40,6 +40,12 @@ print()
 # If the csv file contains an index it can be specified
 pd.read_csv('csv_files/sample_pandas_data.csv', index_col=0)
 
+# Parsing a big csv is slow. csv_cache.py keeps a columnar copy of
+# the file after the first read and reads that copy from then on
+# (until the csv changes). It takes the same arguments as read_csv:
+# from csv_cache import read_csv_cached
+# salaries = read_csv_cached('csv_files/sample_pandas_data.csv')
+
 ## Saving Data Files ################################################
 # df.to_csv('my_data_file.csv')
 
@@ -105,6 +111,15 @@ salaries.loc[
 # isin lets you select values that are in a list
 salaries.loc[salaries.Name.isin(['Frank','Grace'])]
 
+# Each of these checks every row. For big tables, secondary_index.py
+# keeps indexes on chosen columns (saved next to the csv) so matching
+# rows are looked up instead:
+# from secondary_index import IndexedFrame
+# frame = IndexedFrame.from_csv('csv_files/sample_pandas_data.csv')
+# frame.create_index('Name', 'hash') # for == and isin
+# frame.create_index('Salary', 'sorted') # for <, >=, between
+# frame.select((frame.c.Name == 'Frank') & (frame.c.Salary >= 50000))
+
 # isnull and notnull highlight values which are/aren't empty
 salaries.loc[salaries.Salary.isnull()]
 salaries.loc[salaries.Salary.notnull()]
@@ -130,6 +145,16 @@ salaries.Salary.mean() # average value (num only)
 salaries.Name.unique() # list of unique values
 salaries.Name.value_counts() # unique values and their counts
 
+# These need the whole column in memory. For tables too big for that,
+# sketches.py gives close answers (with bounds) from one pass over
+# chunks, in a few hundred KB per column:
+# from chunking import iter_csv_chunks
+# from sketches import sketch_table
+# sketch = sketch_table(iter_csv_chunks('csv_files/sample_pandas_data.csv'), workers=4)
+# summary, bounds = sketch.describe(include='all')
+# sketch.value_counts('Name', n=5)
+# sketch.nunique()
+
 ## Map Functions #################################################
 # Takes set of data and 'maps' them to another set of values.
 # e.g. Change data format or represent in another way.
@@ -150,6 +175,13 @@ def demean_salary(row):
 
 s2 = salaries.apply(demean_salary, axis='columns')
 
+# Functions like demean_salary only use column-friendly operators,
+# so they can run on the whole frame at once. vectorize_apply.py
+# checks that on a sample and falls back to apply when it differs:
+# from vectorize_apply import smart_apply, print_report
+# s2 = smart_apply(salaries, demean_salary)
+# print_report() # vectorized or not, and the speedup
+
 # Pandas will try to recognize operations based on the type.
 # using a single value will apply the operation to each row:
 salaries.Salary - salary_mean
@@ -170,6 +202,12 @@ salaries.groupby('Age').apply(lambda df: df.loc[df.Salary.idxmax()])
 # Grouping can be applied to multiple columns
 salaries.groupby(['Age', 'City']).apply(lambda df: df.loc[df.Salary.idxmax()])
 
+# apply() calls the lambda once per group, which is slow with lots
+# of groups. group_topk.py gets the same rows with one sort:
+# from group_topk import top_k_per_group
+# top_k_per_group(salaries, ['Age', 'City'], 'Salary') # same as above
+# top_k_per_group(salaries, 'City', 'Salary', k=3) # top 3 per city
+
 # agg() allows running multiple functions on the df at once
 salaries.groupby(['City']).Salary.agg([len, min, max])
 
@@ -180,12 +218,25 @@ mi = grouped.index
 type(mi) # <class 'pandas.core.indexes.multi.MultiIndex'>
 grouped.reset_index() # return to a standard index
 
+# On big tables parallel_groupby.py splits the groups between
+# processes and gives the same results:
+# from parallel_groupby import parallel_describe, parallel_agg
+# parallel_describe(salaries, ['City', 'Age'], workers=4)
+# parallel_agg(salaries, ['City'], 'Salary', [len, min, max], workers=4)
+
 ## Sorting ##########################################################
 # Sorting by values, which retains the original index
 salaries.sort_values(by='Salary') # sort ascending
 salaries.sort_values(by='Salary', ascending=False) # descending
 salaries.sort_values(by=['City','Salary'], ascending=False)
 
+# For only the first few rows, external_sort.py picks them without
+# sorting everything, and sorts csv files too big for memory on disk
+# (both stable, keeping the original index):
+# from external_sort import top_n, sort_csv
+# top_n(salaries, 'Salary', 10) # same as sorting descending, head(10)
+# sort_csv('csv_files/sample_pandas_data.csv', 'sorted.csv', by=['City', 'Salary'], ascending=False)
+
 # Sorting by index is also possible
 salaries.sort_index()
 
@@ -206,6 +257,13 @@ salaries.index.dtype # dtype('int64')
 
 # Other dtypes possible include categorical and timeseries data
 
+# Smaller dtypes save memory: Age fits in 1 byte instead of 8, and
+# City as a category stores each city name once. memory_optimizer.py
+# picks the smallest safe dtypes and shows the before/after sizes:
+# from memory_optimizer import optimize, print_report
+# smaller, report = optimize(salaries)
+# print_report(report)
+
 ## Missing Data #####################################################
 # Entries missing values are assigned NaN (not a number).
 # These are always a float64 dtype.
@@ -245,12 +303,21 @@ salaries.rename(index={0:'FirstEntry', 1:'SecondEntry'})
 # canadian_youtube = pd.read_csv("../input/youtube-new/CAvideos.csv")
 # british_youtube = pd.read_csv("../input/youtube-new/GBvideos.csv")
 # pd.concat([canadian_youtube, british_youtube])
+# multi_csv.py reads the files at the same time and puts them
+# together without the extra copy concat makes:
+# from multi_csv import read_csvs
+# youtube = read_csvs('../input/youtube-new/*videos.csv', source_column='file')
+# Files too big to load can be combined a chunk at a time:
+# from external_join import concat_csv, join_csv
+# concat_csv(['CAvideos.csv', 'GBvideos.csv'], 'videos.csv')
 
 # join combines dataframe objects that have an index in common.
 # lsuffix and rsuffix are needed because the data shares col names.
 # left = canadian_youtube.set_index(['title', 'trending_date'])
 # right = british_youtube.set_index(['title', 'trending_date'])
 # left.join(right, lsuffix='_CAN', rsuffix='_UK') # adds suffix to col
+# join_csv('CAvideos.csv', 'GBvideos.csv', ['title', 'trending_date'],
+#          'joined.csv', lsuffix='_CAN', rsuffix='_UK', memory_limit=512 * 2**20)
 
 # example for joining on a shared column
 # powerlifting_combined = (
@@ -1,4 +1,6 @@
 # Run 'python3 -i script.py' to interact with the file.
+# 'python3 -i cell_runner.py script.py' does the same but only re-runs
+# the sections that changed since last time (call rerun() after edits).
 
 ## Importing libraries (modules) ##########################################
 import math 
@@ -0,0 +1,183 @@
+# Shrinking DataFrames by picking smaller dtypes.
+# learn_pandas.py shows salaries.dtypes as int64 for Age/Salary and
+# object (or str) for Name/City. Ages fit in an int8, and a column like
+# City with a handful of distinct values takes far less memory as a
+# category (each row stores a small code, the names are stored once),
+# which also makes groupby on it faster.
+#
+# Usage:
+#   salaries, report = optimize(salaries)
+#   print_report(report)
+#   # or pick the dtypes before loading a csv:
+#   salaries = read_csv_optimized('csv_files/sample_pandas_data.csv')
+import numpy as np
+import pandas as pd
+
+from chunking import iter_csv_chunks
+
+INT_TYPES = ['int8', 'int16', 'int32', 'int64']
+UINT_TYPES = ['uint8', 'uint16', 'uint32', 'uint64']
+
+# text columns become categories when they have at most this share
+# of distinct values (and at most MAX_CATEGORIES of them)
+CATEGORY_RATIO = .5
+MAX_CATEGORIES = 10_000
+
+
+def smallest_int(lo, hi, nullable=False, unsigned=False):
+    '''
+    Smallest integer dtype that holds lo..hi. Signed unless unsigned
+    (unsigned types wrap around on subtraction: Salary - 60000).
+
+    >>> smallest_int(18, 59)
+    'int8'
+    >>> smallest_int(18, 59, unsigned=True)
+    'uint8'
+    >>> smallest_int(-1, 40_000, nullable=True)
+    'Int32'
+    '''
+    types = UINT_TYPES if unsigned and lo >= 0 else INT_TYPES
+    for t in types:
+        info = np.iinfo(t)
+        if info.min <= lo and hi <= info.max:
+            return t.capitalize().replace('Uint', 'UInt') if nullable else t
+    return 'Int64' if nullable else 'int64'
+
+
+def _float32_safe(values):
+    values = values[~np.isnan(values)]
+    return np.array_equal(values.astype('float32').astype('float64'), values)
+
+
+def _whole(values):
+    # ints with blanks read as floats (beyond 2**53 floats aren't exact ints)
+    values = values[~np.isnan(values)]
+    return bool(np.all(values % 1 == 0) and np.all(np.abs(values) <= 2**53))
+
+
+def _text_dtype(n_unique, n_rows, arrow_strings):
+    if n_unique <= MAX_CATEGORIES and n_unique <= CATEGORY_RATIO * n_rows:
+        return 'category'
+    return 'string[pyarrow]' if arrow_strings else None
+
+
+def suggest_dtypes(df, arrow_strings=False, unsigned=False):
+    '''
+    Returns {column: smaller dtype} for the columns that can shrink
+    without losing anything. Floats holding only whole numbers (ints
+    with blanks) become nullable ints, like suggest_csv_dtypes does.
+    High-cardinality text becomes 'string[pyarrow]' if arrow_strings
+    (needs pyarrow), non-negative ints unsigned types if unsigned.
+    '''
+    dtypes = {}
+    for col in df.columns:
+        s = df[col]
+        kind = s.dtype.kind
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(s.dtype):
+            # nullable ints (Int64) stay nullable
+            nullable = isinstance(s.dtype, pd.api.extensions.ExtensionDtype)
+            if s.notnull().any():
+                dtypes[col] = smallest_int(s.min(), s.max(), nullable, unsigned)
+        elif kind == 'f':
+            values = s.to_numpy(dtype='float64', na_value=np.nan)
+            if s.notnull().any() and _whole(values):
+                dtypes[col] = smallest_int(s.min(), s.max(), nullable=True, unsigned=unsigned)
+            elif _float32_safe(values):
+                dtypes[col] = 'float32'
+        elif pd.api.types.is_string_dtype(s.dtype) or kind == 'O':
+            dtype = _text_dtype(s.nunique(), len(s), arrow_strings)
+            if dtype is not None:
+                dtypes[col] = dtype
+    # only keep real changes
+    return {col: t for col, t in dtypes.items() if str(df[col].dtype) != t}
+
+
+def memory_report(before, after):
+    '''Per column dtypes and bytes (deep) before and after.'''
+    report = pd.DataFrame({
+        'before_dtype': before.dtypes.astype(str),
+        'after_dtype': after.dtypes.astype(str),
+        'before_bytes': before.memory_usage(deep=True, index=False),
+        'after_bytes': after.memory_usage(deep=True, index=False),
+    })
+    total = report[['before_bytes', 'after_bytes']].sum()
+    report.loc['(total)'] = ['', '', total.before_bytes, total.after_bytes]
+    report['saved'] = 1 - report.after_bytes / report.before_bytes
+    return report
+
+
+def optimize(df, arrow_strings=False, unsigned=False):
+    '''Returns (df with smaller dtypes, memory_report of the change).'''
+    smaller = df.astype(suggest_dtypes(df, arrow_strings, unsigned))
+    return smaller, memory_report(df, smaller)
+
+
+def print_report(report):
+    print('{:<16} {:>10} {:>16} {:>12} {:>12} {:>7}'.format(
+        'column', 'before', 'after', 'before (KB)', 'after (KB)', 'saved'))
+    for col, r in report.iterrows():
+        print('{:<16} {:>10} {:>16} {:>12.1f} {:>12.1f} {:>6.0%}'.format(
+            str(col)[:16], r.before_dtype, r.after_dtype,
+            r.before_bytes / 1024, r.after_bytes / 1024, r.saved))
+
+
+## CSV files #########################################################
+def suggest_csv_dtypes(path, chunksize=100_000, arrow_strings=False, unsigned=False, **read_kwargs):
+    '''
+    Like suggest_dtypes but for a csv that hasn't been loaded, by
+    scanning it in chunks. Only min/max and (up to MAX_CATEGORIES)
+    distinct values are kept per column, so memory stays small.
+    Returns a dtype dict for pd.read_csv.
+    '''
+    stats = {}
+    n_rows = 0
+    for chunk in iter_csv_chunks(path, chunksize, **read_kwargs):
+        n_rows += len(chunk)
+        for col in chunk.columns:
+            s = chunk[col]
+            st = stats.setdefault(col, {'kind': s.dtype.kind, 'nulls': False,
+                                        'min': np.inf, 'max': -np.inf,
+                                        'whole': True, 'float32': True,
+                                        'uniques': set()})
+            # a col can read as int in one chunk and float in the
+            # next (a missing value shows up), so keep the widest kind
+            if st['kind'] != s.dtype.kind:
+                st['kind'] = 'f' if {st['kind'], s.dtype.kind} <= set('iuf') else 'O'
+            st['nulls'] |= bool(s.hasnans)
+            if s.dtype.kind in 'iuf' and s.notnull().any():
+                st['min'] = min(st['min'], s.min())
+                st['max'] = max(st['max'], s.max())
+                if s.dtype.kind == 'f':
+                    values = s.to_numpy(dtype='float64')
+                    st['float32'] &= _float32_safe(values)
+                    st['whole'] &= _whole(values)
+            # distinct values are tracked for every chunk since a col
+            # that looked numeric can turn out to be text later on
+            if st['uniques'] is not None:
+                st['uniques'].update(s.dropna().unique())
+                if len(st['uniques']) > MAX_CATEGORIES:
+                    st['uniques'] = None # too many, stop tracking
+
+    dtypes = {}
+    for col, st in stats.items():
+        if st['kind'] in 'iu' and st['min'] <= st['max']:
+            dtypes[col] = smallest_int(st['min'], st['max'], st['nulls'], unsigned)
+        elif st['kind'] == 'f' and st['whole'] and st['min'] <= st['max']:
+            dtypes[col] = smallest_int(st['min'], st['max'], nullable=True, unsigned=unsigned)
+        elif st['kind'] == 'f':
+            dtypes[col] = 'float32' if st['float32'] else 'float64'
+        elif st['uniques'] is not None:
+            dtype = _text_dtype(len(st['uniques']), n_rows, arrow_strings)
+            if dtype is not None:
+                dtypes[col] = dtype
+        elif arrow_strings:
+            dtypes[col] = 'string[pyarrow]'
+    return dtypes
+
+
+def read_csv_optimized(path, arrow_strings=False, unsigned=False, **read_kwargs):
+    '''pd.read_csv with the dtypes from suggest_csv_dtypes.'''
+    dtypes = suggest_csv_dtypes(path, arrow_strings=arrow_strings, unsigned=unsigned, **read_kwargs)
+    return pd.read_csv(path, dtype=dtypes, **read_kwargs)
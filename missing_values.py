@@ -0,0 +1,77 @@
+# Streaming version of the 'Missing Values' section of data_cleaning.py.
+# The whole file is never loaded. Each chunk is reduced to a
+# MissingProfile (nulls per col + row count) and the profiles are
+# added together, so peak memory is about one chunk per worker.
+#
+# Usage:
+#   profile = profile_missing('csv_files/dirty_data.csv', chunksize=10)
+#   profile.missing_counts # same as df.isnull().sum()
+#   profile.total_cells # 300
+#   profile.total_missing # 47
+#   profile.percent_missing # 15.666
+import pandas as pd
+
+from chunking import bounded_map, iter_csv_chunks
+
+
+class MissingProfile:
+    '''
+    Null counts per column and number of rows for part of a dataset.
+    Profiles of different chunks can be combined with + (or sum()).
+    '''
+
+    def __init__(self, missing_counts=None, n_rows=0):
+        if missing_counts is None:
+            missing_counts = pd.Series(dtype='int64')
+        self.missing_counts = missing_counts.astype('int64')
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df.isnull().sum(), len(df))
+
+    def __add__(self, other):
+        if not isinstance(other, MissingProfile):
+            return NotImplemented
+        # fill_value=0 keeps cols that only one side has seen
+        counts = self.missing_counts.add(other.missing_counts, fill_value=0)
+        # add() sorts the labels when they differ, keep the csv order
+        order = list(self.missing_counts.index)
+        order += [c for c in other.missing_counts.index if c not in order]
+        return MissingProfile(counts.reindex(order), self.n_rows + other.n_rows)
+
+    def __radd__(self, other):
+        # allows sum(profiles), which starts from 0
+        if other == 0:
+            return self
+        return self.__add__(other)
+
+    @property
+    def total_cells(self):
+        return self.n_rows * len(self.missing_counts)
+
+    @property
+    def total_missing(self):
+        return int(self.missing_counts.sum())
+
+    @property
+    def percent_missing(self):
+        if self.total_cells == 0:
+            return 0.0
+        # same formula as data_cleaning.py so the floats match exactly
+        return (self.total_missing/self.total_cells)*100
+
+    def __repr__(self):
+        return '<MissingProfile rows={} missing={} ({:.3f}%)>'.format(
+            self.n_rows, self.total_missing, self.percent_missing
+        )
+
+
+def profile_missing(path, chunksize=100_000, workers=1, **read_kwargs):
+    '''
+    Returns a MissingProfile for a csv file without loading it whole.
+    workers > 1 profiles chunks in that many processes.
+    '''
+    chunks = iter_csv_chunks(path, chunksize=chunksize, **read_kwargs)
+    profiles = bounded_map(MissingProfile.from_frame, chunks, workers)
+    return sum(profiles, MissingProfile())
@@ -0,0 +1,289 @@
+# Reading many csv files (like one per region) as one table.
+# The Combining section of learn_pandas.py reads CAvideos.csv and
+# GBvideos.csv one after the other and pd.concat copies both into a
+# new frame, so for a moment everything is in memory twice. Here:
+#   - files are split into byte ranges at line ends (big files into
+#     several) and the ranges are parsed at the same time on threads
+#     (pandas' parser lets other threads run) or processes
+#   - the files' columns are lined up: a column a file doesn't have is
+#     missing there, and a column with different types in different
+#     files gets one type (ints and floats become float, anything
+#     else mixed becomes str)
+#   - with pyarrow, every parsed range stays as it is in memory and
+#     becomes one chunk of pyarrow-backed columns, so there is no
+#     concat copy (only columns whose type had to change are copied)
+#   - a source column can say which file each row came from
+# iter_csvs gives the ranges one at a time instead, parsing ahead on
+# the workers, for inputs that don't fit in memory. To give every range
+# the same types it first parses all of them once for their types
+# (unify=False skips that).
+#
+# Usage:
+#   videos = read_csvs(['CAvideos.csv', 'GBvideos.csv'], source_column='file')
+#   videos = read_csvs('regions/*.csv', workers=8)
+#   for chunk in iter_csvs('regions/*.csv', workers=4): ...
+# Like validating_reader.py, files with line breaks inside quoted
+# fields can't be split at line ends: use range_bytes=None for them
+# (one range per file).
+import glob
+import io
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from chunking import bounded_map
+from validating_reader import RANGE_BYTES, byte_ranges
+
+try:
+    import pyarrow as pa
+except ImportError: # pyarrow is optional, without it frames are concatenated
+    pa = None
+
+# read_csv arguments that matter for reading just the header line
+HEADER_ARGS = ('sep', 'delimiter', 'encoding', 'quotechar', 'escapechar')
+
+
+## Files and ranges ##################################################
+def expand_paths(paths):
+    '''A glob pattern, a path or a list of either, as a list of files.'''
+    paths = [paths] if isinstance(paths, (str, os.PathLike)) else list(paths)
+    found = []
+    for path in map(str, paths):
+        if glob.has_magic(path):
+            found += sorted(glob.glob(path))
+        else:
+            found.append(path)
+    return found
+
+
+def _header(path, read_kwargs):
+    kwargs = {k: v for k, v in read_kwargs.items() if k in HEADER_ARGS}
+    return list(pd.read_csv(path, nrows=0, **kwargs).columns)
+
+
+def _tasks(paths, range_bytes, read_kwargs):
+    tasks = []
+    for number, path in enumerate(paths):
+        n_ranges = 1 if not range_bytes else max(1, -(-os.path.getsize(path) // range_bytes))
+        columns = _header(path, read_kwargs)
+        tasks += [(number, path, columns, bounds) for bounds in byte_ranges(path, n_ranges)]
+    return tasks
+
+
+def _read_range(arrow, read_kwargs, task):
+    '''Parses one byte range of a file (one task from _tasks).'''
+    number, path, columns, (start, stop) = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    if arrow:
+        # pyarrow's own parser gives arrow columns directly (and is
+        # faster); pass engine='c' for options it doesn't support
+        read_kwargs = dict({'engine': 'pyarrow'}, **read_kwargs)
+        read_kwargs['dtype_backend'] = 'pyarrow'
+    if not data.strip(): # a file with only a header
+        return number, pd.DataFrame(columns=columns)
+    return number, pd.read_csv(io.BytesIO(data), header=None, names=columns, **read_kwargs)
+
+
+def _label(df, path, row, source_column, all_columns):
+    '''Row numbers within the file, source column and all columns.'''
+    df.index = pd.RangeIndex(row, row + len(df))
+    if source_column:
+        df[source_column] = path
+    return df.reindex(columns=all_columns + ([source_column] if source_column else []))
+
+
+## Schemas ###########################################################
+def _common_type(types):
+    types = [t for t in types if not pa.types.is_null(t)] # all-blank columns
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.large_string()
+
+
+def unify_schemas(schemas):
+    '''One arrow schema for tables read from different files.'''
+    names, types = [], {}
+    for schema in schemas:
+        for field in schema:
+            if field.name not in types:
+                names.append(field.name)
+                types[field.name] = []
+            types[field.name].append(field.type)
+    return pa.schema([(name, _common_type(types[name])) for name in names])
+
+
+def _conform(table, schema):
+    '''table with schema's columns and types; only changed columns are copied.'''
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(len(table), field.type))
+            continue
+        column = table.column(field.name)
+        columns.append(column if column.type == field.type else column.cast(field.type))
+    return pa.table(columns, schema=schema)
+
+
+def _pandas_types(df):
+    # dtype of each column, None for all-blank ones (any type fits them)
+    return {col: None if df[col].isna().all() else df[col].dtype for col in df.columns}
+
+
+def common_dtypes(parts):
+    '''
+    The unify_schemas rule for frames parsed without pyarrow: given
+    _pandas_types of each part, {column: dtype} that fits every part.
+    A part without the column counts as blank (ints become floats).
+    '''
+    columns = list(dict.fromkeys(col for types in parts for col in types))
+    dtypes = {}
+    for col in columns:
+        types = [types.get(col) for types in parts]
+        known = [t for t in types if t is not None]
+        if not known:
+            continue
+        kinds = {t.kind for t in known}
+        same = len(set(map(str, types))) == 1
+        if kinds <= set('iuf'):
+            dtypes[col] = known[0] if same else 'float64'
+        elif kinds == {'b'}:
+            dtypes[col] = known[0] if same else 'boolean'
+        elif kinds == {'M'}:
+            continue # dates come from parse_dates, not dtype
+        elif len(set(map(str, known))) == 1:
+            dtypes[col] = known[0]
+        else:
+            dtypes[col] = 'str'
+    return dtypes
+
+
+def _astype(df, dtypes):
+    # only the columns that need it are copied
+    changed = {col: t for col, t in dtypes.items()
+               if col in df and str(df[col].dtype) != str(pd.api.types.pandas_dtype(t))}
+    return df.astype(changed) if changed else df
+
+
+def _with_dtypes(read_kwargs, dtypes):
+    # dtypes passed by the caller win
+    given = read_kwargs.get('dtype') or {}
+    return dict(read_kwargs, dtype=dict(dtypes, **given))
+
+
+def _range_types(arrow, read_kwargs, task):
+    _, df = _read_range(arrow, read_kwargs, task)
+    return pa.Table.from_pandas(df, preserve_index=False).schema if arrow else _pandas_types(df)
+
+
+## Reading ###########################################################
+def read_csvs(paths, workers=None, source_column=None, ignore_index=False, zero_copy=True,
+              processes=False, range_bytes=RANGE_BYTES, **read_kwargs):
+    '''
+    Same as pd.concat([pd.read_csv(p, **read_kwargs) for p in paths])
+    with the files parsed concurrently. paths can be a glob pattern.
+    The index is each row's number in its file (like that concat)
+    unless ignore_index. source_column names a column (categorical)
+    with the path each row came from.
+
+    With zero_copy=True (and pyarrow installed) columns use
+    pyarrow-backed dtypes made of the parsed pieces, without copying
+    them into one block. zero_copy=False gives the usual numpy dtypes
+    through pd.concat, which costs a copy.
+    '''
+    paths = expand_paths(paths)
+    workers = workers or os.cpu_count()
+    arrow = zero_copy and pa is not None
+    tasks = _tasks(paths, range_bytes, read_kwargs)
+    read = partial(_read_range, arrow, read_kwargs)
+    parts = list(bounded_map(read, tasks, workers, max_pending=len(tasks), threads=not processes))
+    if not parts:
+        return pd.DataFrame()
+
+    numbers = np.array([number for number, _ in parts])
+    lengths = np.array([len(df) for _, df in parts])
+    if arrow:
+        tables = [pa.Table.from_pandas(df, preserve_index=False) for _, df in parts]
+        schema = unify_schemas(t.schema for t in tables)
+        table = pa.concat_tables([_conform(t, schema) for t in tables])
+        del tables, parts
+        df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    else:
+        dtypes = {}
+        if isinstance(read_kwargs.get('dtype') or {}, dict):
+            types = [_pandas_types(part) for _, part in parts]
+            dtypes = _with_dtypes(read_kwargs, common_dtypes(types))['dtype']
+            # ranges that got another type are parsed again with the common
+            # one (casting would make 35.0 of an int column with blanks '35.0')
+            reread = partial(_read_range, False, dict(read_kwargs, dtype=dtypes))
+            for i, task in enumerate(tasks):
+                if any(str(types[i].get(col)) not in ('None', str(pd.api.types.pandas_dtype(t)))
+                       for col, t in dtypes.items()):
+                    parts[i] = reread(task)
+        df = pd.concat([part for _, part in parts], ignore_index=True)
+        del parts
+        # blanks from files without a column (or with only a header)
+        df = _astype(df, dtypes)
+
+    if not ignore_index:
+        # rows count up from 0 in each file, over all of its ranges
+        starts = np.cumsum(lengths) - lengths
+        file_starts = pd.Series(starts).groupby(numbers).transform('min').to_numpy()
+        df.index = np.arange(len(df)) - np.repeat(file_starts, lengths)
+    if source_column:
+        categories = list(dict.fromkeys(paths))
+        file_codes = np.array([categories.index(p) for p in paths])
+        codes = np.repeat(file_codes[numbers], lengths)
+        df[source_column] = pd.Categorical.from_codes(codes, categories=categories)
+    return df
+
+
+def iter_csvs(paths, workers=None, source_column=None, zero_copy=False,
+              processes=False, range_bytes=RANGE_BYTES, unify=True, **read_kwargs):
+    '''
+    Yields the rows of the files as DataFrames, one per byte range in
+    file order, while the next ranges are parsed on the workers. Every
+    frame has the columns of all the files, and is indexed by row
+    number in its file like iter_csv_chunks.
+
+    A column gets the same type in every frame, the one read_csvs
+    gives it, found by parsing all the ranges once beforehand.
+    unify=False skips that pass, and types may then differ between
+    frames (a range of Age without 'Thirty' is int).
+    '''
+    paths = expand_paths(paths)
+    workers = workers or os.cpu_count()
+    tasks = _tasks(paths, range_bytes, read_kwargs)
+    all_columns = []
+    for _, _, columns, _ in tasks:
+        all_columns += [c for c in columns if c not in all_columns]
+
+    arrow = zero_copy and pa is not None
+    schema, dtypes = None, {}
+    if unify and isinstance(read_kwargs.get('dtype') or {}, dict):
+        types = list(bounded_map(partial(_range_types, arrow, read_kwargs), tasks, workers,
+                                 threads=not processes))
+        if arrow:
+            schema = unify_schemas(types)
+        else:
+            read_kwargs = _with_dtypes(read_kwargs, common_dtypes(types))
+            dtypes = read_kwargs['dtype']
+
+    read = partial(_read_range, arrow, read_kwargs)
+    rows = {}
+    for (number, path, _, _), (_, df) in zip(tasks, bounded_map(read, tasks, workers, threads=not processes)):
+        if schema is not None:
+            table = _conform(pa.Table.from_pandas(df, preserve_index=False), schema)
+            df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        row = rows.get(number, 0)
+        rows[number] = row + len(df)
+        yield _astype(_label(df, path, row, source_column, all_columns), dtypes)
@@ -0,0 +1,137 @@
+# Turning messy number columns into real numbers.
+# dirty_data.csv stores Salary as strings like "60,000", 50K and
+# blanks, so pandas can't load it as a number column. Everything here
+# uses vectorized string methods (no per-cell python functions) and
+# values that still can't be read are reported instead of raising.
+#
+# Usage:
+#   df, bad = read_numeric_csv('csv_files/dirty_data.csv', ['Age', 'Salary'])
+#   df.dtypes # Age and Salary are Int64 (nullable int)
+#   bad # row, column and value of cells like 'Thirty'
+import pandas as pd
+
+from chunking import iter_csv_chunks
+
+# currency symbols and spaces are dropped before parsing
+# (apostrophes are swiss thousands separators: 1'000)
+JUNK_CHARS = r"[\s$€£¥']"
+
+# suffixes like 50K or 1.5M
+MULTIPLIERS = {'k': 10**3, 'm': 10**6, 'b': 10**9}
+
+
+def detect_decimal(strings):
+    '''
+    Guesses whether a column uses '.' or ',' as the decimal mark.
+
+    The last separator in a number is the decimal mark if both kinds
+    appear (1.234,5) or if it isn't followed by exactly 3 digits
+    (12,5). Something like "60,000" doesn't count either way.
+
+    >>> detect_decimal(pd.Series(['1.234,5', '60,000', '7,25']))
+    ','
+    >>> detect_decimal(pd.Series(['60,000', '1,234.5']))
+    '.'
+    '''
+    strings = strings.astype('string')
+    last = strings.str.extract(r'([.,])(\d+)$')
+    sep, tail_len = last[0], last[1].str.len()
+    has_both = (
+        strings.str.contains('.', regex=False)
+        & strings.str.contains(',', regex=False)
+    )
+    decisive = (has_both | (tail_len != 3)).fillna(False)
+    comma_votes = ((sep == ',') & decisive).sum()
+    dot_votes = ((sep == '.') & decisive).sum()
+    return ',' if comma_votes > dot_votes else '.'
+
+
+def _strip(col):
+    '''
+    col as strings without junk characters or a K/M/B suffix, the
+    multiplier each suffix stood for, and which values had one.
+    '''
+    s = col.astype('string').str.replace(JUNK_CHARS, '', regex=True)
+    suffix = s.str[-1:].str.lower()
+    multiplier = suffix.map(MULTIPLIERS).astype('Float64').fillna(1)
+    has_suffix = suffix.isin(list(MULTIPLIERS)).fillna(False)
+    return s.where(~has_suffix, s.str[:-1]), multiplier, has_suffix
+
+
+def coerce_numeric(col, decimal=None):
+    '''
+    Converts a column of number-like strings to a nullable number column.
+
+    Returns a tuple where result[0] is an Int64 Series (Float64 if any
+    value has a fraction) and result[1] is a Series of the original
+    values that weren't numbers. Missing values stay missing and
+    aren't reported. decimal is '.' or ',' (guessed when None).
+    '''
+    s, multiplier, has_suffix = _strip(col)
+    decimal = decimal or detect_decimal(s)
+    thousands = ',' if decimal == '.' else '.'
+    s = s.str.replace(thousands, '', regex=False)
+    if decimal != '.':
+        s = s.str.replace(decimal, '.', regex=False)
+
+    # only plain numbers are allowed through (to_numeric also accepts
+    # things like 'inf' or '1e5' which are more likely typos here)
+    is_number = s.str.fullmatch(r'[+-]?(\d+\.?\d*|\.\d+)').fillna(False)
+    # plain integers go straight to Int64, through float64 the ones
+    # above 2**53 would be rounded (18 digits always fit in an int64)
+    is_int = s.str.fullmatch(r'[+-]?\d{1,18}').fillna(False) & ~has_suffix
+    # (arrow's cast to int doesn't take a '+' sign)
+    ints = s.where(is_int).str.replace(r'^\+', '', regex=True).astype('Int64')
+    floats = pd.to_numeric(s.where(is_number & ~is_int), errors='coerce')
+    floats = floats.astype('Float64') * multiplier
+
+    # (floats too big for an int64 stay floats)
+    if (((floats % 1 == 0) & (floats.abs() < 2**63)) | floats.isnull()).all():
+        numbers = ints.fillna(floats.astype('Int64'))
+    else:
+        numbers = ints.astype('Float64').fillna(floats)
+    numbers.name = col.name
+    bad = col[numbers.isnull() & col.notnull()]
+    return numbers, bad
+
+
+def read_numeric_csv(path, columns, decimal=None, chunksize=None, **read_kwargs):
+    '''
+    Reads a csv with the given columns converted by coerce_numeric.
+
+    The columns are read with the string dtype so no intermediate
+    object column is built, and with chunksize the file is converted
+    a chunk at a time. Returns a tuple of the DataFrame and a report
+    of bad cells (row label, column, value).
+    '''
+    dtype = dict(read_kwargs.pop('dtype', None) or {})
+    dtype.update({c: 'string' for c in columns})
+
+    if chunksize is None:
+        chunks = [pd.read_csv(path, dtype=dtype, **read_kwargs)]
+    else:
+        chunks = iter_csv_chunks(path, chunksize, dtype=dtype, **read_kwargs)
+
+    frames, reports = [], []
+    decimals = dict.fromkeys(columns, decimal)
+    for chunk in chunks:
+        for c in columns:
+            # guess the decimal mark once (from the first chunk) so
+            # every chunk of a column is read the same way, from the
+            # same cleaned strings coerce_numeric would guess it from
+            if decimals[c] is None:
+                decimals[c] = detect_decimal(_strip(chunk[c].dropna())[0])
+            chunk[c], bad = coerce_numeric(chunk[c], decimals[c])
+            reports.append(pd.DataFrame(
+                {'row': bad.index, 'column': c, 'value': bad.to_numpy()}
+            ))
+        frames.append(chunk)
+
+    if not frames: # only a header
+        frames = [pd.read_csv(path, nrows=0, dtype=dtype, **read_kwargs)]
+        for c in columns:
+            frames[0][c] = frames[0][c].astype('Int64')
+    df = pd.concat(frames) if len(frames) > 1 else frames[0]
+    report = pd.concat(reports, ignore_index=True) if reports else \
+        pd.DataFrame({'row': [], 'column': [], 'value': []})
+    return df, report.sort_values('row', kind='stable', ignore_index=True)
@@ -0,0 +1,225 @@
+# Groupby aggregations spread over several processes.
+# learn_pandas.py runs salaries.groupby(['City', 'Age']).describe() and
+# groupby(['City']).Salary.agg([len, min, max]) on one core. Here:
+#   1. every row gets its group number (ngroup), and groups are
+#      hash-partitioned between workers (group number % workers)
+#   2. group numbers and the value columns are put in shared memory,
+#      so workers read them without a copy being pickled to them
+#   3. each worker picks out the rows of its own groups, sorts them
+#      by (group, value) and computes count, sum, mean, std, min, max
+#      and quantiles with segment reductions
+#   4. the per-worker results are put back together in group order
+#      with the same (Multi)Index and columns pandas gives
+# A group only ever lives in one partition, so quantiles are exact
+# and the result matches pandas. Numbering the groups still takes one
+# serial pass, so with a single worker pandas' own groupby is used.
+#
+# Usage:
+#   parallel_describe(salaries, ['City', 'Age'], workers=4)
+#   parallel_agg(salaries, ['City'], 'Salary', [len, min, max], workers=4)
+import os
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from chunking import bounded_map
+
+# what describe() shows, in order
+DESCRIBE_STATS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+# builtins that agg() accepts, by the name pandas gives their column
+FUNC_NAMES = {len: 'len', min: 'min', max: 'max', sum: 'sum'}
+QUANTILES = {'25%': .25, '50%': .5, 'median': .5, '75%': .75}
+
+
+## Shared memory #####################################################
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+
+## Worker ############################################################
+def _code_dtype(n_groups):
+    # numpy radix sorts 8 and 16 bit ints
+    return 'int16' if n_groups < 2**15 else 'int64'
+
+
+def _segment_stats(codes, values, n_groups, stats):
+    '''Stats of values per group, codes being 0..n_groups-1.'''
+    # rows per group, missing values included
+    out = {'size': np.bincount(codes, minlength=n_groups)}
+
+    keep = ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    # sort by value, then (stable) by group: small ints sort much
+    # faster than np.lexsort on both
+    order = np.argsort(values, kind='stable')
+    order = order[np.argsort(codes[order], kind='stable')]
+    values = values[order]
+
+    count = np.bincount(codes, minlength=n_groups)
+    stops = np.cumsum(count)
+    starts = stops - count
+    has = count > 0
+    out['count'] = count
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.zeros(n_groups)
+        if has.any():
+            total[has] = np.add.reduceat(values, starts[has])
+        mean = total / count
+        # two-pass variance, same as pandas up to rounding
+        dev = values - np.repeat(mean[has], count[has])
+        sq = np.zeros(n_groups)
+        if has.any():
+            sq[has] = np.add.reduceat(dev**2, starts[has])
+        var = sq / (count - 1)
+    var[count < 2] = np.nan
+    out.update(sum=total, mean=mean, var=var, std=np.sqrt(var))
+
+    first = np.full(n_groups, np.nan)
+    last = np.full(n_groups, np.nan)
+    first[has] = values[starts[has]]
+    last[has] = values[stops[has] - 1]
+    out.update(min=first, max=last)
+
+    for name, q in QUANTILES.items():
+        if name not in stats:
+            continue
+        # linear interpolation, like pandas/numpy
+        pos = q * (count - 1)
+        lo = np.floor(pos).astype('int64')
+        frac = pos - lo
+        result = np.full(n_groups, np.nan)
+        lo_idx = (starts + lo)[has]
+        hi_idx = np.minimum(lo_idx + 1, stops[has] - 1)
+        result[has] = values[lo_idx] + frac[has] * (values[hi_idx] - values[lo_idx])
+        out[name] = result
+    return {s: out[s] for s in stats}
+
+
+def _worker(codes_spec, value_specs, stats, n_groups, workers, partition):
+    handles = []
+    try:
+        shm, codes = _attach(codes_spec)
+        handles.append(shm)
+        # this partition's groups are partition, partition + workers, ...
+        # so group // workers numbers them 0..n-1
+        rows = np.flatnonzero((codes >= 0) & (codes % workers == partition))
+        groups = np.arange(partition, n_groups, workers)
+        local = (codes[rows] // workers).astype(_code_dtype(len(groups)))
+
+        results = []
+        for spec in value_specs:
+            shm, values = _attach(spec)
+            handles.append(shm)
+            results.append(_segment_stats(local, values[rows], len(groups), stats))
+        return groups, results
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+## Main ##############################################################
+def grouped_stats(df, by, columns, stats, workers=None):
+    '''
+    Returns (group keys index, {column: {stat: array}}) for the groups
+    of df.groupby(by), computed in workers processes.
+    '''
+    keys = [by] if isinstance(by, str) else list(by)
+    workers = workers or os.cpu_count()
+    # rows with a missing key are in no group (-1), like groupby's dropna
+    codes = df.groupby(keys, sort=True).ngroup().to_numpy(dtype='float64', na_value=np.nan)
+    codes = np.nan_to_num(codes, nan=-1).astype('int64')
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+
+    shms = []
+    try:
+        shm, codes_spec = _to_shared(codes)
+        shms.append(shm)
+        value_specs = []
+        for col in columns:
+            shm, spec = _to_shared(df[col].to_numpy(dtype='float64', na_value=np.nan))
+            shms.append(shm)
+            value_specs.append(spec)
+
+        # the workers find their own rows (in parallel) from the codes
+        work = partial(_worker, codes_spec, value_specs, stats, n_groups, workers)
+        parts = list(bounded_map(work, range(workers), workers))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    # put the partitions back in group order
+    groups = np.concatenate([g for g, _ in parts]) if parts else np.array([], 'int64')
+    resort = np.argsort(groups)
+    results = {}
+    for i, col in enumerate(columns):
+        results[col] = {
+            s: np.concatenate([r[i][s] for _, r in parts])[resort] for s in stats
+        }
+
+    # the keys of each group, from the first row that has it
+    _, first_rows = np.unique(codes, return_index=True)
+    first_rows = first_rows[codes[first_rows] >= 0]
+    key_rows = df[keys].iloc[first_rows]
+    if len(keys) == 1:
+        index = pd.Index(key_rows[keys[0]].to_numpy(), name=keys[0])
+    else:
+        index = pd.MultiIndex.from_frame(key_rows)
+    return index, results
+
+
+def parallel_describe(df, by, workers=None):
+    '''Same as df.groupby(by).describe() for the numeric columns.'''
+    keys = [by] if isinstance(by, str) else list(by)
+    columns = [
+        c for c in df.select_dtypes('number').columns if c not in keys
+    ]
+    if (workers or os.cpu_count()) == 1:
+        return df.groupby(keys)[columns].describe()
+    index, results = grouped_stats(df, keys, columns, DESCRIBE_STATS, workers)
+    data = {
+        (col, stat): results[col][stat].astype('float64')
+        for col in columns for stat in DESCRIBE_STATS
+    }
+    return pd.DataFrame(data, index=index)
+
+
+def parallel_agg(df, by, columns, funcs, workers=None):
+    '''
+    Same as df.groupby(by)[columns].agg(funcs) for funcs made of
+    len/'size', 'count', 'sum', 'mean', 'std', 'var', min, max, 'median'.
+    A single column name gives columns named after the funcs, like
+    groupby(...).Salary.agg([...]).
+    '''
+    single = isinstance(columns, str)
+    cols = [columns] if single else list(columns)
+    if (workers or os.cpu_count()) == 1:
+        return df.groupby(by)[columns].agg(funcs)
+    names = [FUNC_NAMES.get(f, f) for f in funcs]
+    stats = ['size' if n == 'len' else n for n in names]
+    index, results = grouped_stats(df, by, cols, stats, workers)
+
+    data = {}
+    for col in cols:
+        is_int = pd.api.types.is_integer_dtype(df[col].dtype)
+        for name, stat in zip(names, stats):
+            values = results[col][stat]
+            if stat in ('size', 'count'):
+                values = values.astype('int64')
+            elif is_int and stat in ('min', 'max', 'sum') and not np.isnan(values).any():
+                # pandas keeps ints as ints for these
+                values = values.astype(df[col].dtype)
+            data[name if single else (col, name)] = values
+    return pd.DataFrame(data, index=index)
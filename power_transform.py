@@ -0,0 +1,207 @@
+# Box-Cox / Yeo-Johnson for many columns at once.
+# data_cleaning.py normalizes one array with stats.boxcox, which runs
+# its own lambda search per call. Here the lambdas of all columns are
+# searched together:
+#   1. the log-likelihood of every column is evaluated on a shared
+#      grid of lambdas (one numpy expression per grid point covers all
+#      columns) to find the peak of each column roughly
+#   2. a golden-section search, run in lockstep for all columns (each
+#      step evaluates one lambda per column), narrows it down to the
+#      precision scipy gives
+# The log-likelihood and the range picked around the best grid point
+# come from incremental_scaling.py, whose chunked Box-Cox fitter uses
+# the same two helpers.
+# Blocks of columns go to different processes, and fitted lambdas are
+# kept in a small json cache keyed by column name and a hash of the
+# column's data, so refitting an unchanged column is free.
+# Yeo-Johnson also works for zero and negative values.
+#
+# Usage:
+#   transformer = PowerTransformer('box-cox', cache_path='lambdas.json', workers=4)
+#   normalized = transformer.fit_transform(df[numeric_cols])
+#   transformer.lambdas # {column: lambda}
+#   transformer.transform(new_batch) # same lambdas, no refitting
+import json
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from chunking import bounded_map
+from cleaning_pipeline import hash_data
+from incremental_scaling import bracket_peak, llf_from_stats
+
+METHODS = ['box-cox', 'yeo-johnson']
+GRID = np.linspace(-2, 2, 17)
+INV_PHI = (np.sqrt(5) - 1) / 2
+TOLERANCE = 1e-9
+
+
+## Transforms ########################################################
+def yeojohnson(x, lmbda):
+    '''Yeo-Johnson transform, with lmbda broadcast against x (columns).'''
+    x = np.asarray(x, dtype='float64')
+    lmbda = np.broadcast_to(np.asarray(lmbda, dtype='float64'), x.shape)
+    out = np.full(x.shape, np.nan)
+    pos, neg = x >= 0, x < 0
+
+    # x >= 0: ((x + 1)**lmbda - 1) / lmbda, or log1p(x) at lmbda 0
+    lp, xp = lmbda[pos], x[pos]
+    near = np.abs(lp) < 1e-19
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[pos] = np.where(near, np.log1p(xp), np.expm1(lp * np.log1p(xp)) / lp)
+    # x < 0: -((1 - x)**(2 - lmbda) - 1) / (2 - lmbda), or -log1p(-x) at 2
+    ln, xn = 2 - lmbda[neg], x[neg]
+    near = np.abs(ln) < 1e-19
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[neg] = -np.where(near, np.log1p(-xn), np.expm1(ln * np.log1p(-xn)) / ln)
+    return out
+
+
+def transform(x, lmbda, method='box-cox'):
+    if method == 'box-cox':
+        return special.boxcox(x, lmbda)
+    return yeojohnson(x, lmbda)
+
+
+## Fitting ###########################################################
+def _log_term(x, method):
+    # the jacobian part of the log-likelihood, per column
+    if method == 'box-cox':
+        return np.nansum(np.log(x), axis=0)
+    return np.nansum(np.sign(x) * np.log1p(np.abs(x)), axis=0)
+
+
+def llf(x, lmbda, method='box-cox', log_term=None):
+    '''
+    Log-likelihood of lmbda[j] for column x[:, j], for every column at
+    once (missing values are skipped). Same as scipy's boxcox_llf /
+    yeojohnson_llf per column.
+    '''
+    x = np.asarray(x, dtype='float64')
+    log_term = _log_term(x, method) if log_term is None else log_term
+    n = np.sum(~np.isnan(x), axis=0)
+    y = transform(x, lmbda, method)
+    return llf_from_stats(lmbda, log_term, n, np.nanvar(y, axis=0))
+
+
+def fit_lambdas(x, method='box-cox', grid=GRID, tolerance=TOLERANCE):
+    '''The lambda of every column of x (2d array) that maximizes llf.'''
+    x = np.asarray(x, dtype='float64')
+    if x.ndim == 1:
+        x = x[:, None]
+    if method == 'box-cox' and np.any(x <= 0):
+        raise ValueError('Data must be positive for box-cox.')
+    k = x.shape[1]
+    log_term = _log_term(x, method)
+    evaluate = partial(llf, x, method=method, log_term=log_term)
+
+    # 1. the shared grid
+    scores = np.array([evaluate(np.full(k, lmb)) for lmb in grid])
+    lo, hi = bracket_peak(grid, scores)
+
+    # 2. golden-section search, all columns in step
+    c = hi - INV_PHI * (hi - lo)
+    d = lo + INV_PHI * (hi - lo)
+    fc, fd = evaluate(c), evaluate(d)
+    while np.max(hi - lo) > tolerance:
+        left = fc > fd # the peak is in [lo, d]
+        hi = np.where(left, d, hi)
+        lo = np.where(left, lo, c)
+        # one of the old points is reused, only the new one is evaluated
+        new = np.where(left, hi - INV_PHI * (hi - lo), lo + INV_PHI * (hi - lo))
+        f_new = evaluate(new)
+        c, d, fc, fd = (
+            np.where(left, new, d), np.where(left, c, new),
+            np.where(left, f_new, fd), np.where(left, fc, f_new),
+        )
+    return (lo + hi) / 2
+
+
+def _fit_block(method, x):
+    return fit_lambdas(x, method)
+
+
+def fit_columns(df, method='box-cox', workers=1, block_size=None):
+    '''
+    {column: lambda} for every column of df, with blocks of columns
+    fitted in separate processes.
+    '''
+    x = df.to_numpy(dtype='float64', na_value=np.nan)
+    block_size = block_size or max(1, -(-x.shape[1] // max(1, workers)))
+    blocks = [x[:, i:i + block_size] for i in range(0, x.shape[1], block_size)]
+    lambdas = np.concatenate(list(bounded_map(partial(_fit_block, method), blocks, workers))) \
+        if blocks else []
+    return dict(zip(df.columns, map(float, lambdas)))
+
+
+## Transformer #######################################################
+class LambdaCache:
+    '''Fitted lambdas in a json file, keyed by method, column and data hash.'''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lambdas = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.lambdas = json.load(f)
+
+    @staticmethod
+    def key(method, column, fingerprint):
+        return '{}|{}|{}'.format(method, column, fingerprint)
+
+    def get(self, key):
+        return self.lambdas.get(key)
+
+    def update(self, found):
+        self.lambdas.update(found)
+        if self.path is not None:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.lambdas, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+class PowerTransformer:
+    '''
+    Box-Cox or Yeo-Johnson on every column of a DataFrame, each with
+    its own lambda. Lambdas are reused from the cache for columns
+    whose data was fitted before.
+    '''
+
+    def __init__(self, method='box-cox', cache_path=None, workers=1):
+        if method not in METHODS:
+            raise ValueError('method must be one of {}'.format(METHODS))
+        self.method = method
+        self.workers = workers
+        self.cache = LambdaCache(cache_path)
+        self.lambdas = {}
+        self.cached = [] # columns whose lambda came from the cache
+
+    def fit(self, df):
+        df = pd.DataFrame(df)
+        keys = {col: LambdaCache.key(self.method, col, hash_data(df[col])) for col in df.columns}
+        self.lambdas = {col: self.cache.get(key) for col, key in keys.items()}
+        self.cached = [col for col, lmb in self.lambdas.items() if lmb is not None]
+
+        todo = [col for col in df.columns if self.lambdas[col] is None]
+        if todo:
+            found = fit_columns(df[todo], self.method, self.workers)
+            self.lambdas.update(found)
+            self.cache.update({keys[col]: lmb for col, lmb in found.items()})
+        return self
+
+    def transform(self, df):
+        '''Applies the fitted lambdas to df (a new batch is fine).'''
+        df = pd.DataFrame(df)
+        missing = [col for col in df.columns if col not in self.lambdas]
+        if missing:
+            raise ValueError('no lambda fitted for columns {}'.format(missing))
+        lambdas = np.array([self.lambdas[col] for col in df.columns])
+        x = df.to_numpy(dtype='float64', na_value=np.nan)
+        return pd.DataFrame(transform(x, lambdas, self.method), index=df.index, columns=df.columns)
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
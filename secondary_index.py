@@ -0,0 +1,379 @@
+# Secondary indexes for the selections in learn_pandas.py.
+# salaries.loc[salaries.Name == 'Frank'] compares every row. With an
+# index on Name the matching row positions are looked up directly:
+#   hash index   - value -> list of rows, for == and isin
+#   sorted index - values in sorted order, for <, <=, >, >=, between
+# Indexes are saved next to the csv (data.csv.Name.hash.idx) and are
+# rebuilt automatically if the csv changed. Rows added with append()
+# are merged into the indexes.
+#
+# Conditions are written against frame.c and combined with & and |,
+# like the pandas masks they replace:
+#   frame = IndexedFrame.from_csv('csv_files/sample_pandas_data.csv')
+#   frame.create_index('Name', 'hash')
+#   frame.create_index('Salary', 'sorted')
+#   frame.select(frame.c.Name == 'Frank')
+#   frame.select((frame.c.Name == 'Frank') & (frame.c.Salary >= 50000))
+#   frame.select(frame.c.Name.isin(['Frank', 'Grace']))
+# Columns without an index still work, they are just scanned.
+import operator
+import os
+import pickle
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+EMPTY = np.array([], dtype='int64')
+
+
+## Indexes ###########################################################
+class HashIndex:
+    '''Inverted index: each distinct value -> the rows that have it.'''
+    kind = 'hash'
+
+    def __init__(self, values):
+        self.codes_of = {} # value -> code
+        self.order = EMPTY # row positions sorted by code
+        self.sorted_codes = EMPTY
+        self.n_rows = 0
+        self.append(values)
+
+    def append(self, values):
+        '''Adds rows (their positions continue after the existing ones).'''
+        values = pd.Series(values).reset_index(drop=True)
+        for v in values.dropna().unique():
+            self.codes_of.setdefault(v, len(self.codes_of))
+        codes = values.map(self.codes_of).fillna(-1).to_numpy(dtype='int64')
+
+        # new rows come after the old ones, so a stable sort of the
+        # joined codes keeps every posting list in row order
+        positions = np.arange(self.n_rows, self.n_rows + len(codes))
+        all_codes = np.concatenate([self.sorted_codes, codes])
+        all_rows = np.concatenate([self.order, positions])
+        resort = np.argsort(all_codes, kind='stable')
+        self.sorted_codes, self.order = all_codes[resort], all_rows[resort]
+        self.offsets = np.searchsorted(self.sorted_codes, np.arange(len(self.codes_of) + 1))
+        self.n_rows += len(codes)
+
+    def equal(self, value):
+        code = self.codes_of.get(value)
+        if code is None:
+            return EMPTY
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+    def count(self, value):
+        code = self.codes_of.get(value)
+        return 0 if code is None else self.offsets[code + 1] - self.offsets[code]
+
+    def isin(self, values):
+        found = [self.equal(v) for v in set(values)]
+        return np.sort(np.concatenate(found)) if found else EMPTY
+
+
+class SortedIndex:
+    '''The column's values in sorted order with their row positions.'''
+    kind = 'sorted'
+
+    def __init__(self, values):
+        self.keys = None
+        self.order = EMPTY
+        self.n_rows = 0
+        self.append(values)
+
+    def append(self, values):
+        values = pd.Series(values).reset_index(drop=True)
+        present = values.notnull().to_numpy()
+        new_keys = values[present].to_numpy()
+        positions = np.flatnonzero(present) + self.n_rows
+
+        # merging two sorted runs with a stable sort is close to linear
+        keys = new_keys if self.keys is None else np.concatenate([self.keys, new_keys])
+        rows = np.concatenate([self.order, positions])
+        resort = np.argsort(keys, kind='stable')
+        self.keys, self.order = keys[resort], rows[resort]
+        self.n_rows += len(values)
+
+    def _bounds(self, lo, hi, lo_inclusive, hi_inclusive):
+        start = 0 if lo is None else np.searchsorted(self.keys, lo, 'left' if lo_inclusive else 'right')
+        stop = len(self.keys) if hi is None else np.searchsorted(self.keys, hi, 'right' if hi_inclusive else 'left')
+        return start, max(start, stop)
+
+    def range(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True):
+        start, stop = self._bounds(lo, hi, lo_inclusive, hi_inclusive)
+        return np.sort(self.order[start:stop])
+
+    def count_range(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True):
+        start, stop = self._bounds(lo, hi, lo_inclusive, hi_inclusive)
+        return stop - start
+
+    def equal(self, value):
+        return self.range(value, value)
+
+    def count(self, value):
+        return self.count_range(value, value)
+
+    def isin(self, values):
+        found = [self.equal(v) for v in set(values)]
+        return np.sort(np.concatenate(found)) if found else EMPTY
+
+
+INDEX_KINDS = {'hash': HashIndex, 'sorted': SortedIndex}
+
+
+## Conditions ########################################################
+class Condition(ABC):
+    '''A selection on an IndexedFrame, combine with & and |.'''
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    @abstractmethod
+    def positions(self, frame):
+        '''Sorted row positions that match.'''
+
+    def filter(self, frame, positions):
+        '''The given positions that also match.'''
+        return np.intersect1d(positions, self.positions(frame), assume_unique=True)
+
+    def estimate(self, frame):
+        '''Roughly how many rows match (all of them if unknown).'''
+        return len(frame.df)
+
+
+class Compare(Condition):
+    OPS = {
+        '==': operator.eq, '!=': operator.ne, '<': operator.lt,
+        '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    }
+
+    def __init__(self, col, op, value):
+        self.col, self.op, self.value = col, op, value
+
+    def _range(self):
+        # (lo, hi, lo_inclusive, hi_inclusive) for a sorted index
+        inclusive = '=' in self.op
+        if self.op.startswith('<'):
+            return None, self.value, True, inclusive
+        return self.value, None, inclusive, True
+
+    def estimate(self, frame):
+        index = frame.indexes.get(self.col)
+        if index is not None and self.op == '==':
+            return index.count(self.value)
+        if isinstance(index, SortedIndex) and self.op != '!=':
+            return index.count_range(*self._range())
+        return len(frame.df)
+
+    def positions(self, frame):
+        index = frame.indexes.get(self.col)
+        if index is not None and self.op == '==':
+            return index.equal(self.value)
+        if isinstance(index, SortedIndex) and self.op != '!=':
+            return index.range(*self._range())
+        return np.flatnonzero(self.OPS[self.op](frame.df[self.col], self.value).to_numpy())
+
+    def filter(self, frame, positions):
+        # checking a few rows directly beats looking up all matches
+        values = frame.df[self.col].iloc[positions]
+        return positions[self.OPS[self.op](values, self.value).to_numpy()]
+
+
+class Between(Condition):
+    def __init__(self, col, lo, hi):
+        self.col, self.lo, self.hi = col, lo, hi
+
+    def estimate(self, frame):
+        index = frame.indexes.get(self.col)
+        if isinstance(index, SortedIndex):
+            return index.count_range(self.lo, self.hi)
+        return len(frame.df)
+
+    def positions(self, frame):
+        index = frame.indexes.get(self.col)
+        if isinstance(index, SortedIndex):
+            return index.range(self.lo, self.hi)
+        return np.flatnonzero(frame.df[self.col].between(self.lo, self.hi).to_numpy())
+
+    def filter(self, frame, positions):
+        return positions[frame.df[self.col].iloc[positions].between(self.lo, self.hi).to_numpy()]
+
+
+class IsIn(Condition):
+    def __init__(self, col, values):
+        self.col, self.values = col, list(values)
+
+    def estimate(self, frame):
+        index = frame.indexes.get(self.col)
+        if index is not None:
+            return sum(index.count(v) for v in set(self.values))
+        return len(frame.df)
+
+    def positions(self, frame):
+        index = frame.indexes.get(self.col)
+        if index is not None:
+            return index.isin(self.values)
+        return np.flatnonzero(frame.df[self.col].isin(self.values).to_numpy())
+
+    def filter(self, frame, positions):
+        return positions[frame.df[self.col].iloc[positions].isin(self.values).to_numpy()]
+
+
+class And(Condition):
+    def __init__(self, left, right):
+        self.left, self.right = left, right
+
+    def estimate(self, frame):
+        return min(self.left.estimate(frame), self.right.estimate(frame))
+
+    def positions(self, frame):
+        # look up the side with fewer matches, then only check those
+        # rows against the other side
+        first, second = self.left, self.right
+        if second.estimate(frame) < first.estimate(frame):
+            first, second = second, first
+        return second.filter(frame, first.positions(frame))
+
+    def filter(self, frame, positions):
+        return self.right.filter(frame, self.left.filter(frame, positions))
+
+
+class Or(Condition):
+    def __init__(self, left, right):
+        self.left, self.right = left, right
+
+    def estimate(self, frame):
+        return min(len(frame.df), self.left.estimate(frame) + self.right.estimate(frame))
+
+    def positions(self, frame):
+        return np.union1d(self.left.positions(frame), self.right.positions(frame))
+
+
+class ColumnRef:
+    '''frame.c.Name: builds conditions on a column.'''
+
+    def __init__(self, col):
+        self.col = col
+
+    def __eq__(self, value):
+        return Compare(self.col, '==', value)
+
+    def __ne__(self, value):
+        return Compare(self.col, '!=', value)
+
+    def __lt__(self, value):
+        return Compare(self.col, '<', value)
+
+    def __le__(self, value):
+        return Compare(self.col, '<=', value)
+
+    def __gt__(self, value):
+        return Compare(self.col, '>', value)
+
+    def __ge__(self, value):
+        return Compare(self.col, '>=', value)
+
+    def isin(self, values):
+        return IsIn(self.col, values)
+
+    def between(self, lo, hi):
+        return Between(self.col, lo, hi)
+
+
+class Columns:
+    def __init__(self, frame):
+        self._frame = frame
+
+    def __getattr__(self, col):
+        if col not in self._frame.df.columns:
+            raise AttributeError(col)
+        return ColumnRef(col)
+
+    def __getitem__(self, col):
+        return ColumnRef(col)
+
+
+## Frame #############################################################
+class IndexedFrame:
+    '''A DataFrame plus secondary indexes saved next to its csv.'''
+
+    def __init__(self, df, path=None, index_col=None):
+        self.df = df
+        self.path = path
+        # the csv has the index as its first column(s) if not None
+        self.index_col = index_col
+        self.indexes = {}
+        self.c = Columns(self)
+
+    @classmethod
+    def from_csv(cls, path, **read_kwargs):
+        '''Reads a csv and loads any saved indexes that are still valid.'''
+        frame = cls(pd.read_csv(path, **read_kwargs), path, read_kwargs.get('index_col'))
+        folder = os.path.dirname(path) or '.'
+        prefix = os.path.basename(path) + '.'
+        for name in os.listdir(folder):
+            if name.startswith(prefix) and name.endswith('.idx'):
+                col, kind = name[len(prefix):-len('.idx')].rsplit('.', 1)
+                frame._load_index(col, kind)
+        return frame
+
+    def _index_path(self, col, kind):
+        return '{}.{}.{}.idx'.format(self.path, col, kind)
+
+    def _source_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_index(self, col, kind):
+        with open(self._index_path(col, kind), 'rb') as f:
+            saved = pickle.load(f)
+        if saved['source'] == self._source_stat() and saved['index'].n_rows == len(self.df):
+            self.indexes[col] = saved['index']
+        else:
+            # the csv changed since the index was made
+            self.create_index(col, kind)
+
+    def save_index(self, col):
+        if self.path is None:
+            return
+        index = self.indexes[col]
+        with open(self._index_path(col, index.kind), 'wb') as f:
+            pickle.dump({'source': self._source_stat(), 'index': index}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def create_index(self, col, kind='hash'):
+        '''Builds (and saves, if the frame has a csv) an index on col.'''
+        if col in self.indexes and self.indexes[col].kind != kind:
+            self.drop_index(col) # or the old kind would be loaded next time too
+        self.indexes[col] = INDEX_KINDS[kind](self.df[col])
+        self.save_index(col)
+        return self.indexes[col]
+
+    def drop_index(self, col):
+        index = self.indexes.pop(col)
+        if self.path is not None and os.path.exists(self._index_path(col, index.kind)):
+            os.remove(self._index_path(col, index.kind))
+
+    def append(self, rows, write=True):
+        '''
+        Adds rows to the frame (and to the end of its csv if write),
+        updating the indexes instead of rebuilding them. Rows keep
+        their labels if the frame has its own index (like index_col),
+        otherwise they are numbered on like reading the csv again would.
+        '''
+        rows = rows[self.df.columns]
+        if write and self.path is not None:
+            rows.to_csv(self.path, mode='a', header=False, index=self.index_col is not None)
+        numbered = self.index_col is None and isinstance(self.df.index, pd.RangeIndex) \
+            and self.df.index.equals(pd.RangeIndex(len(self.df)))
+        self.df = pd.concat([self.df, rows], ignore_index=numbered)
+        for col, index in self.indexes.items():
+            index.append(rows[col])
+            self.save_index(col)
+
+    def select(self, condition):
+        '''Rows matching condition, same as df.loc[mask] would give.'''
+        return self.df.iloc[condition.positions(self)]
@@ -0,0 +1,278 @@
+# Time and memory per "## Section ####" block of the notes scripts.
+# The script is run one top-level statement at a time, and every
+# function it defines is wrapped, so work is charged to the section
+# the code is written in (data_cleaning.py does its work in functions
+# that run() calls, learn_pandas.py at the top level). Per section:
+#   wall / cpu - seconds spent in the section's own code (calls into
+#                other sections are charged to those)
+#   peak       - most extra memory (tracemalloc, so python and numpy)
+#                needed while it ran
+#   copies     - pandas results of bare expressions, like df.dropna()
+#                on a line of its own, that allocated new memory and
+#                were thrown away (with the bytes wasted)
+# The report is a table, and optionally folded stacks
+# ("script;section;line 12 1234") for flamegraph.pl or speedscope.
+#
+# Usage:
+#   python3 section_profiler.py learn_pandas.py
+#   python3 section_profiler.py data_cleaning.py --folded cleaning.folded -- --no-plots
+import argparse
+import ast
+import functools
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# '## Name ####' (a line starting with ## that ends in a run of #)
+SECTION = re.compile(r'^##\s*(.*?)\s*#{3,}\s*$')
+TOP = '(top)'
+
+
+def split_sections(source):
+    '''Returns [(section name, first line number)] in file order.'''
+    sections = [(TOP, 1)]
+    for number, line in enumerate(source.splitlines(), 1):
+        match = SECTION.match(line)
+        if match:
+            sections.append((match.group(1), number))
+    return sections
+
+
+def _is_pandas(value):
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(value, (pd.DataFrame, pd.Series))
+
+
+def _buffers(obj):
+    '''(address, size) of the memory holding a Series/DataFrame's values.'''
+    columns = [obj] if obj.ndim == 1 else [obj.iloc[:, i] for i in range(obj.shape[1])]
+    found = []
+    for col in columns:
+        values = col.array
+        if hasattr(values, '__arrow_array__') and not hasattr(values, '_mask'):
+            for chunk in values.__arrow_array__().chunks:
+                found += [(b.address, b.size) for b in chunk.buffers() if b is not None]
+            continue
+        if hasattr(values, 'codes'): # categorical
+            arrays = [values.codes]
+        elif hasattr(values, '_mask'): # Int64, boolean, ...
+            arrays = [values._data, values._mask]
+        else:
+            arrays = [np.asarray(values)]
+        for a in arrays:
+            if a.dtype != object:
+                found.append((a.__array_interface__['data'][0], a.nbytes))
+    return found
+
+
+def _copied_bytes(value, namespace):
+    '''Bytes of value's data that aren't shared with frames in namespace.'''
+    owned = [
+        (start, start + size)
+        for obj in namespace.values() if _is_pandas(obj)
+        for start, size in _buffers(obj)
+    ]
+    return sum(
+        size for start, size in _buffers(value)
+        if size and not any(lo <= start < hi for lo, hi in owned)
+    )
+
+
+class SectionStats:
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.calls = 0
+        self.copies = 0
+        self.copy_bytes = 0
+
+
+class _Frame:
+    def __init__(self, key, start_mem):
+        self.key = key
+        self.start_mem = start_mem
+        self.peak = start_mem
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+
+## Profiler ##########################################################
+class SectionProfiler:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(path)
+        with open(self.path) as f:
+            self.source = f.read()
+        self.sections = split_sections(self.source)
+        self.stats = defaultdict(SectionStats)
+        self.folded = defaultdict(float) # stack -> seconds
+        self.copies = [] # (section, line, source, bytes)
+        self._stack = []
+
+    def section_of(self, line):
+        name = TOP
+        for section, first in self.sections:
+            if first > line:
+                break
+            name = section
+        return name
+
+    @contextmanager
+    def _measure(self, section, label):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.peak = max(parent.peak, peak)
+        tracemalloc.reset_peak()
+        frame = _Frame((section, label), current)
+        self._stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._stack.pop()
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+            stats = self.stats[section]
+            stats.wall += wall - frame.child_wall
+            stats.cpu += cpu - frame.child_cpu
+            stats.peak = max(stats.peak, frame.peak - frame.start_mem)
+            stats.calls += 1
+            stack = [self.name] + ['{};{}'.format(*f.key) for f in self._stack] + ['{};{}'.format(section, label)]
+            self.folded[';'.join(stack)] += wall - frame.child_wall
+            if self._stack:
+                parent = self._stack[-1]
+                parent.child_wall += wall
+                parent.child_cpu += cpu
+                parent.peak = max(parent.peak, frame.peak)
+
+    def _wrap(self, func, section):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._measure(section, func.__name__ + '()'):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _run_statement(self, node, namespace):
+        section = self.section_of(node.lineno)
+        label = 'line {}'.format(node.lineno)
+        if isinstance(node, ast.Expr):
+            code = compile(ast.Expression(node.value), self.path, 'eval')
+        else:
+            code = compile(ast.Module([node], type_ignores=[]), self.path, 'exec')
+
+        with self._measure(section, label):
+            value = eval(code, namespace)
+        if isinstance(node, ast.Expr) and _is_pandas(value):
+            # a plain column lookup or a view shares its data with a
+            # frame the script holds, so only data of its own counts
+            new_bytes = _copied_bytes(value, namespace)
+            if new_bytes > 0:
+                stats = self.stats[section]
+                stats.copies += 1
+                stats.copy_bytes += new_bytes
+                self.copies.append((section, node.lineno, ast.get_source_segment(self.source, node), new_bytes))
+        del value
+
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            namespace[node.name] = self._wrap(namespace[node.name], section)
+
+    def run(self, argv=()):
+        '''Runs the script as __main__ (with argv) and collects the stats.'''
+        tree = ast.parse(self.source, self.path)
+        namespace = {'__name__': '__main__', '__file__': self.path, '__builtins__': __builtins__}
+        old_argv, old_cwd, old_path = sys.argv, os.getcwd(), list(sys.path)
+        # the scripts read files relative to where they live
+        sys.argv = [self.path] + list(argv)
+        os.chdir(os.path.dirname(self.path))
+        sys.path.insert(0, os.path.dirname(self.path))
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            for node in tree.body:
+                self._run_statement(node, namespace)
+        finally:
+            if started:
+                tracemalloc.stop()
+            sys.argv, sys.path[:] = old_argv, old_path
+            os.chdir(old_cwd)
+        return self
+
+    ## Reports #######################################################
+    def rows(self):
+        '''One dict per section, in file order.'''
+        return [
+            {'section': name, 'wall': s.wall, 'cpu': s.cpu, 'peak_bytes': s.peak,
+             'calls': s.calls, 'copies': s.copies, 'copy_bytes': s.copy_bytes}
+            for name, s in ((name, self.stats[name]) for name, _ in self.sections)
+            if s.calls
+        ]
+
+    def print_report(self, sort=None, file=None):
+        rows = self.rows()
+        if sort:
+            rows.sort(key=lambda r: r[sort], reverse=True)
+        print('{:<32} {:>9} {:>9} {:>10} {:>7} {:>11}'.format(
+            'section', 'wall (ms)', 'cpu (ms)', 'peak (KB)', 'copies', 'copied (KB)'), file=file)
+        for r in rows:
+            print('{:<32} {:>9.1f} {:>9.1f} {:>10.1f} {:>7} {:>11.1f}'.format(
+                r['section'][:32], r['wall'] * 1000, r['cpu'] * 1000,
+                r['peak_bytes'] / 1024, r['copies'], r['copy_bytes'] / 1024), file=file)
+        if self.copies:
+            print('\nresults computed and thrown away:', file=file)
+            for section, line, source, size in sorted(self.copies, key=lambda c: -c[3]):
+                print('  {}:{:<5} {:>9.1f} KB  {}'.format(
+                    self.name, line, size / 1024, source.splitlines()[0][:60]), file=file)
+
+    def save_folded(self, path):
+        '''Folded stacks (microseconds) for flamegraph.pl / speedscope.'''
+        with open(path, 'w') as f:
+            for stack, seconds in self.folded.items():
+                f.write('{} {}\n'.format(stack.replace(' ', '_'), max(1, round(seconds * 1e6))))
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'script': self.name, 'sections': self.rows(), 'copies': self.copies}, f, indent=2)
+
+
+def profile_sections(path, argv=()):
+    '''Runs the script at path and returns its SectionProfiler.'''
+    return SectionProfiler(path).run(argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time and memory per ## section of a script.')
+    parser.add_argument('script', help='script to run (arguments for it go after --)')
+    parser.add_argument('--sort', choices=['wall', 'cpu', 'peak_bytes', 'copy_bytes'],
+                        help='sort sections by this instead of file order')
+    parser.add_argument('--folded', help='also write folded stacks to this file')
+    parser.add_argument('--json', help='also write the results as json')
+    # everything after -- goes to the script
+    argv = sys.argv[1:] if argv is None else list(argv)
+    split = argv.index('--') if '--' in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+    script_args = argv[split + 1:]
+
+    profiler = profile_sections(args.script, script_args)
+    print()
+    profiler.print_report(args.sort)
+    if args.folded:
+        profiler.save_folded(args.folded)
+    if args.json:
+        profiler.save_json(args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+# Approximate describe(), nunique(), unique() and value_counts() for
+# tables too big for the exact versions in learn_pandas.py (which
+# need every value in memory, or a hash table as big as the number of
+# distinct values). Each column is summarized by small sketches that
+# are filled in one pass over chunks and can be merged, so chunks can
+# be sketched in different processes:
+#   HyperLogLog   - number of distinct values (16 KB, about 0.8% error)
+#   space-saving  - the most common values and their counts
+#   KLL           - quantiles (25%, 50%, 75%) to within a rank error
+# count, mean, std, min and max are exact. Memory stays at a few
+# hundred KB per column however many rows there are. A column that is
+# numeric in some chunks and text in others (Age with 'Thirty') is
+# described as text, like pandas does when reading the whole file.
+#
+# Usage:
+#   sketch = sketch_table(iter_csv_chunks('big.csv'), workers=4)
+#   summary, bounds = sketch.describe() # bounds of the approximate cells
+#   sketch.value_counts('Name', n=5)    # with the least each count can be
+#   sketch.nunique()
+#   values, exact = sketch.unique('Name')
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from chunking import bounded_map
+
+PERCENTILES = (.25, .5, .75)
+
+
+def _is_number(values):
+    return pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+
+
+def _text(values):
+    '''
+    Numbers (no missing ones) as the text a csv has for them, 3.0 as
+    '3', so they match the same values in chunks read as strings.
+    '''
+    if pd.api.types.is_integer_dtype(values):
+        return pd.Index(values.astype('str'), dtype='object')
+    x = np.asarray(values, dtype='float64')
+    whole = (x % 1 == 0) & (np.abs(x) < 2**53)
+    text = np.where(whole, np.where(whole, x, 0).astype('int64').astype('str'), x.astype('str'))
+    return pd.Index(text, dtype='object')
+
+
+def _hashes(values):
+    # numbers as text so 3 and 3.0 (and '3' from a chunk where the
+    # column is read as strings) hash the same
+    values = _text(values) if _is_number(values) else values.astype('str')
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+def _bit_length(w):
+    # frexp is exact for 32 bit halves, a float64 of the whole isn't
+    hi = (w >> np.uint64(32)).astype('float64')
+    lo = (w & np.uint64(0xffffffff)).astype('float64')
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+
+
+## Distinct counts ###################################################
+class HyperLogLog:
+    '''
+    Estimates the number of distinct values from 2**precision one byte
+    registers. Each register keeps the longest run of leading zero bits
+    seen in the hashes that land on it.
+    '''
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(2**precision, dtype='uint8')
+
+    def add(self, values):
+        '''values is a Series or Index without missing values.'''
+        h = _hashes(values)
+        bits = 64 - self.precision
+        index = (h >> np.uint64(bits)).astype('int64')
+        rest = h & np.uint64((1 << bits) - 1)
+        rank = (bits - _bit_length(rest) + 1).astype('uint8')
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('can only merge HyperLogLogs of the same precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self):
+        '''Standard error of estimate() as a fraction of the true count.'''
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = .7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int64')))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            # few distinct values: count the empty registers instead
+            return m * np.log(m / zeros)
+        return raw
+
+
+## Heavy hitters #####################################################
+class SpaceSaving:
+    '''
+    Keeps counts for at most capacity values. A count may be too high
+    by up to its error, and a value that isn't kept occurred at most
+    floor times, so every value seen more than floor times is kept.
+    '''
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.errors = pd.Series(dtype='int64')
+        self.floor = 0
+
+    def add(self, counts):
+        '''counts is value_counts() of a chunk.'''
+        part = SpaceSaving(self.capacity)
+        part.counts = counts.astype('int64')
+        part.errors = pd.Series(0, index=counts.index, dtype='int64')
+        return self.merge(part._truncate())
+
+    def merge(self, other):
+        keys = self.counts.index.append(other.counts.index).unique()
+        # a value missing from one side occurred there at most floor times
+        counts = self.counts.reindex(keys, fill_value=self.floor) \
+            + other.counts.reindex(keys, fill_value=other.floor)
+        errors = self.errors.reindex(keys, fill_value=self.floor) \
+            + other.errors.reindex(keys, fill_value=other.floor)
+        self.counts, self.errors = counts, errors
+        self.floor += other.floor
+        return self._truncate()
+
+    def _truncate(self):
+        order = np.argsort(-self.counts.to_numpy(), kind='stable')
+        if len(order) > self.capacity:
+            self.floor = max(self.floor, int(self.counts.iloc[order[self.capacity]]))
+            order = order[:self.capacity]
+        self.counts = self.counts.iloc[order]
+        self.errors = self.errors.iloc[order]
+        return self
+
+    def as_text(self):
+        '''A copy with numbers as their text (see _text), adding up any that meet.'''
+        text = SpaceSaving(self.capacity)
+        keys = _text(self.counts.index)
+        text.counts = self.counts.groupby(keys, sort=False).sum()
+        text.errors = self.errors.groupby(keys, sort=False).sum()
+        text.floor = self.floor
+        return text._truncate()
+
+    def top(self, n=None):
+        '''DataFrame of the n most common values with count and lower bound.'''
+        counts = self.counts.iloc[:n]
+        return pd.DataFrame({'count': counts, 'low': counts - self.errors.iloc[:n]})
+
+
+## Quantiles #########################################################
+class KLL:
+    '''
+    Quantile sketch (Karnin, Lang & Liberty). Level h holds items that
+    stand for 2**h values each. When a level fills up it is sorted and
+    every other item (starting at a random one of the first two) moves
+    up a level. Lower levels get geometrically less room.
+    '''
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3)**depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            # an odd item out stays behind
+            pairs = len(items) - len(items) % 2
+            self.levels[level] = items[pairs:]
+            promoted = items[:pairs][self.rng.integers(2)::2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # the capacities of lower levels shrink as levels are added
+            level = 0
+        return self
+
+    def add(self, values):
+        '''values is an array without missing values.'''
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype='float64')])
+        self.n += len(values)
+        return self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        return self._compress()
+
+    @property
+    def rank_error(self):
+        '''
+        Quantiles are off by at most this fraction of n in rank (99%
+        of the time; the fit Apache DataSketches gives for its KLL).
+        '''
+        return 2.296 / self.k**.9723
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype='float64')
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(a), 2.0**h) for h, a in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        # each item sits in the middle of the (0-based) ranks it stands
+        # for, so with nothing compacted yet this is pandas' quantile
+        ranks = np.cumsum(weights) - (weights + 1) / 2
+        return np.interp(q * (weights.sum() - 1), ranks, items)
+
+
+## Columns and tables ################################################
+class ColumnSketch:
+    '''All the sketches of one column, plus exact count/mean/std/min/max.'''
+
+    def __init__(self, precision=14, capacity=1000, k=200):
+        self.numeric = None
+        self.rows = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.distinct = HyperLogLog(precision)
+        self.frequent = SpaceSaving(capacity)
+        self.quantiles = KLL(k)
+
+    def _kind(self, numeric):
+        # a column that is numeric in some chunks and not in others (Age
+        # is 'Thirty' in one) is text, like it is when read whole: the
+        # moments and quantiles are dropped and counted values keyed by text
+        if self.numeric is None:
+            self.numeric = numeric
+        elif self.numeric and numeric is False:
+            self.numeric = False
+            self.mean, self.m2, self.min, self.max = 0.0, 0.0, np.inf, -np.inf
+            self.quantiles = KLL(self.quantiles.k)
+            self.frequent = self.frequent.as_text()
+
+    def add(self, values):
+        self.rows += len(values)
+        values = values.dropna()
+        if values.empty:
+            return self # all missing says nothing about the type
+        numeric = _is_number(values)
+        self._kind(numeric)
+        if numeric and not self.numeric:
+            values = pd.Series(_text(values))
+        # hashing the distinct values is enough for the HyperLogLog
+        counts = values.value_counts(sort=False)
+        self.distinct.add(counts.index)
+        self.frequent.add(counts)
+        if self.numeric:
+            x = values.to_numpy(dtype='float64')
+            mean = x.mean()
+            self._merge_moments(len(x), mean, np.sum((x - mean)**2), x.min(), x.max())
+            self.quantiles.add(x)
+        else:
+            self.count += len(values)
+        return self
+
+    def _merge_moments(self, count, mean, m2, lo, hi):
+        # Chan's parallel variance formula
+        n = self.count + count
+        if n:
+            delta = mean - self.mean
+            self.m2 += m2 + delta**2 * self.count * count / n
+            self.mean += delta * count / n
+        self.count = n
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def merge(self, other):
+        self._kind(other.numeric)
+        self.rows += other.rows
+        frequent = other.frequent
+        if self.numeric:
+            self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.count += other.count
+            if other.numeric:
+                frequent = frequent.as_text()
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(frequent)
+        return self
+
+
+class TableSketch:
+    '''
+    Sketches of every column of a table, filled with partial_fit(df)
+    a chunk at a time. Sketches of different chunks can be merged.
+    '''
+
+    def __init__(self, precision=14, capacity=1000, k=200):
+        self.settings = {'precision': precision, 'capacity': capacity, 'k': k}
+        self.columns = {}
+
+    def partial_fit(self, df):
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnSketch(**self.settings)
+            self.columns[col].add(df[col])
+        return self
+
+    def merge(self, other):
+        for col, sketch in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(sketch)
+            else:
+                self.columns[col] = sketch
+        return self
+
+    ## Results #######################################################
+    def _numeric(self, include):
+        numeric = [c for c, s in self.columns.items() if s.numeric]
+        if include == 'all':
+            return list(self.columns)
+        # like pandas: numeric columns, or all of them if there are none
+        return numeric or list(self.columns)
+
+    def describe(self, percentiles=PERCENTILES, include=None):
+        '''
+        Returns a tuple of the describe()-shaped summary and its bounds:
+        low/high for each approximate cell (percentiles, unique, freq).
+        count, mean, std, min, max and top are from exact counts.
+        '''
+        columns = self._numeric(include)
+        labels = ['{:g}%'.format(100 * p) for p in percentiles]
+        summary, bounds = {}, []
+        for col in columns:
+            s = self.columns[col]
+            stats = {'count': s.count}
+            if not s.numeric:
+                unique = s.distinct.estimate()
+                spread = 3 * s.distinct.relative_error * unique
+                top = s.frequent.top(1)
+                stats.update(unique=round(unique))
+                bounds.append((col, 'unique', max(0, unique - spread), unique + spread))
+                if len(top):
+                    stats.update(top=top.index[0], freq=top['count'].iloc[0])
+                    bounds.append((col, 'freq', top['low'].iloc[0], top['count'].iloc[0]))
+            else:
+                std = np.sqrt(s.m2 / (s.count - 1)) if s.count > 1 else np.nan
+                stats.update(mean=s.mean if s.count else np.nan, std=std,
+                             min=s.min if s.count else np.nan)
+                eps = s.quantiles.rank_error
+                values = s.quantiles.quantile(percentiles)
+                low = s.quantiles.quantile(np.clip(np.array(percentiles) - eps, 0, 1))
+                high = s.quantiles.quantile(np.clip(np.array(percentiles) + eps, 0, 1))
+                for label, value, lo, hi in zip(labels, values, low, high):
+                    stats[label] = value
+                    bounds.append((col, label, lo, hi))
+                stats['max'] = s.max if s.count else np.nan
+            summary[col] = stats
+
+        order = ['count', 'unique', 'top', 'freq', 'mean', 'std', 'min'] + labels + ['max']
+        summary = pd.DataFrame(summary, columns=columns)
+        summary = summary.reindex([r for r in order if r in summary.index])
+        if all(self.columns[c].numeric for c in columns):
+            summary = summary.astype('float64')
+        bounds = pd.DataFrame(bounds, columns=['column', 'statistic', 'low', 'high']) \
+            .set_index(['column', 'statistic'])
+        return summary, bounds
+
+    def nunique(self, confidence=3):
+        '''Estimated distinct values per column, +- confidence standard errors.'''
+        rows = []
+        for col, s in self.columns.items():
+            estimate = s.distinct.estimate()
+            spread = confidence * s.distinct.relative_error * estimate
+            rows.append((col, round(estimate), max(0, estimate - spread), estimate + spread))
+        return pd.DataFrame(rows, columns=['column', 'estimate', 'low', 'high']).set_index('column')
+
+    def value_counts(self, column, n=10):
+        '''
+        The n most common values of column. The true count of each is
+        between low and count; any value missing from the full list
+        (up to capacity values) occurred at most floor() times.
+        '''
+        return self.columns[column].frequent.top(n)
+
+    def floor(self, column):
+        return self.columns[column].frequent.floor
+
+    def unique(self, column):
+        '''
+        Returns a tuple of the values seen in column and whether that
+        list is complete (it is when there were at most capacity values).
+        '''
+        frequent = self.columns[column].frequent
+        return frequent.counts.index.to_numpy(), frequent.floor == 0
+
+    def mean(self):
+        return pd.Series({c: s.mean for c, s in self.columns.items() if s.numeric and s.count})
+
+
+def sketch_table(source, workers=1, **sketch_kwargs):
+    '''
+    Sketches a table given as chunks (an iterable of DataFrames, or a
+    function returning one), using several processes if asked.
+    '''
+    sketch_chunk = partial(_sketch_chunk, sketch_kwargs)
+    chunks = source() if callable(source) else source
+    sketch = TableSketch(**sketch_kwargs)
+    for part in bounded_map(sketch_chunk, chunks, workers):
+        sketch.merge(part)
+    return sketch
+
+
+def _sketch_chunk(sketch_kwargs, chunk):
+    return TableSketch(**sketch_kwargs).partial_fit(chunk)
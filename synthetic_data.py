@@ -0,0 +1,255 @@
+# Synthetic data shaped like the files in csv_files, at any size.
+# learn_schema() looks at an existing csv and works out, per column:
+#   id       - 1, 2, 3, ... (continued for the new rows)
+#   category - few distinct values (or text), sampled with the same
+#              frequencies (blanks, 'NaN', 'Thirty' etc. included as is)
+#   number   - sampled from the observed quantiles, and written in
+#              the same mix of styles (60000 / "60,000" / 60K / blank)
+#   date     - uniform between the first and last date, written in
+#              the same mix of formats (2020/04/25, 15-02-2021, ...)
+# generate() then makes the rows in shards. Every shard has its own
+# seed (seed, shard number), so the output is the same no matter how
+# many worker processes are used, and only a few shards are in memory
+# at once.
+#
+# Usage:
+#   python3 synthetic_data.py csv_files/dirty_data.csv big_dirty.csv --rows 10000000 --workers 4
+#   python3 synthetic_data.py csv_files/sample_pandas_data.csv parts/ --rows 1e9 --format parquet
+import argparse
+import json
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from chunking import bounded_map
+from date_parsing import SHAPE_FORMATS, date_shapes, parse_dates
+from numeric_coercion import coerce_numeric
+
+# columns with at most this many distinct values, and this share of
+# the rows, are sampled as is (a small file has few distinct values
+# in every column, so numbers and dates there still get their models).
+# Anything that isn't a number or a date is sampled as is too.
+MAX_CATEGORIES = 50
+CATEGORY_SHARE = .05
+
+# how numbers are written, checked in this order
+NUMBER_STYLES = {
+    'blank': r'',
+    'nan_text': r'(?i)nan',
+    'plain': r'-?\d+(\.\d+)?',
+    'thousands': r'-?\d{1,3}(,\d{3})+(\.\d+)?',
+    'k_suffix': r'\d+(\.\d+)?[kK]',
+}
+
+
+## Learning ##########################################################
+def _frequencies(values):
+    counts = values.value_counts(sort=False)
+    return {'values': counts.index.tolist(), 'probs': (counts / counts.sum()).tolist()}
+
+
+def _number_style(raw):
+    style = pd.Series('other', index=raw.index)
+    for name, pattern in reversed(list(NUMBER_STYLES.items())):
+        style[raw.str.fullmatch(pattern)] = name
+    return style
+
+
+def learn_column(raw):
+    '''Works out the model for one column of raw strings (see top of file).'''
+    n = len(raw)
+    numbers, _ = coerce_numeric(raw.replace('', None), decimal='.')
+    is_number = numbers.notnull()
+
+    if is_number.all() and (numbers == np.arange(1, n + 1)).all():
+        return {'kind': 'id'}
+    if raw.nunique() <= min(MAX_CATEGORIES, CATEGORY_SHARE * n):
+        return {'kind': 'category', **_frequencies(raw)}
+
+    if is_number.mean() >= .5:
+        clean = numbers[is_number].astype('float64')
+        style = _number_style(raw)
+        return {
+            'kind': 'number',
+            'quantiles': np.quantile(clean, np.linspace(0, 1, 101)).tolist(),
+            'integer': bool((clean % 1 == 0).all()),
+            'styles': _frequencies(style),
+            'other': _frequencies(raw[style == 'other']) if (style == 'other').any() else None,
+        }
+
+    dates, _ = parse_dates(raw.replace('', None))
+    if dates.notnull().mean() >= .5:
+        shapes = date_shapes(raw).where(dates.notnull(), 'blank')
+        # strftime format per shape, or 'blank' for missing dates
+        formats = shapes.map(lambda shape: SHAPE_FORMATS.get(shape, 'blank'))
+        return {
+            'kind': 'date',
+            'first': str(dates.min().date()),
+            'last': str(dates.max().date()),
+            'formats': _frequencies(formats),
+        }
+
+    return {'kind': 'category', **_frequencies(raw)}
+
+
+def learn_schema(path):
+    '''Returns {column: model} learned from an existing csv.'''
+    # read everything as text so blanks and dirty values are kept
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return {col: learn_column(raw[col]) for col in raw.columns}
+
+
+def save_schema(schema, path):
+    with open(path, 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def load_schema(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+## Generating ########################################################
+def _sample(rng, freqs, n):
+    values = np.array(freqs['values'], dtype=object)
+    return values[rng.choice(len(values), size=n, p=freqs['probs'])]
+
+
+def _format_numbers(values, styles, model, rng):
+    if model['integer']:
+        out = values.astype(str).astype(object)
+    else:
+        out = np.char.mod('%.2f', values).astype(object)
+    out[styles == 'blank'] = ''
+    out[styles == 'nan_text'] = 'NaN'
+
+    rows = styles == 'thousands'
+    spec = ',' if model['integer'] else ',.2f'
+    out[rows] = [format(v, spec) for v in values[rows]]
+    rows = styles == 'k_suffix'
+    out[rows] = np.char.add(np.round(values[rows] / 1000).astype('int64').astype(str), 'K')
+    rows = styles == 'other'
+    if rows.any():
+        out[rows] = _sample(rng, model['other'], rows.sum())
+    return out
+
+
+def generate_column(model, start, n, rng):
+    '''n values for rows start, start+1, ... of a column.'''
+    kind = model['kind']
+    if kind == 'id':
+        return np.arange(start + 1, start + n + 1)
+    if kind == 'category':
+        return _sample(rng, model, n)
+
+    if kind == 'number':
+        qs = model['quantiles']
+        values = np.interp(rng.random(n), np.linspace(0, 1, len(qs)), qs)
+        if model['integer']:
+            values = np.round(values).astype('int64')
+        styles = _sample(rng, model['styles'], n)
+        return _format_numbers(values, styles, model, rng)
+
+    if kind == 'date':
+        first, last = np.datetime64(model['first']), np.datetime64(model['last'])
+        days = rng.integers(0, (last - first).astype(int) + 1, n)
+        dates = pd.Series(first + days.astype('timedelta64[D]'))
+        formats = pd.Series(_sample(rng, model['formats'], n))
+        out = pd.Series('', index=dates.index, dtype=object)
+        # one strftime call per format
+        for fmt in formats.unique():
+            if fmt != 'blank':
+                rows = formats == fmt
+                out[rows] = dates[rows].dt.strftime(fmt)
+        return out.to_numpy()
+
+    raise ValueError('unknown column kind: {}'.format(kind))
+
+
+def generate_shard(schema, n_rows, shard_rows, seed, shard):
+    '''The rows of one shard. Always the same for the same seed and shard.'''
+    start = shard * shard_rows
+    n = min(shard_rows, n_rows - start)
+    rng = np.random.default_rng([seed, shard])
+    return pd.DataFrame({
+        col: generate_column(model, start, n, rng) for col, model in schema.items()
+    })
+
+
+## Writing ###########################################################
+def _write_part(fmt, out_dir, schema, n_rows, shard_rows, seed, shard):
+    # used when writing a folder: each worker writes its own file
+    df = generate_shard(schema, n_rows, shard_rows, seed, shard)
+    path = os.path.join(out_dir, 'part-{:05d}.{}'.format(shard, fmt))
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+    return path
+
+
+def generate(schema, n_rows, out, fmt='csv', workers=1, shard_rows=1_000_000, seed=0):
+    '''
+    Writes n_rows of synthetic data to out.
+
+    If out is a folder (ends with a slash or already exists as one)
+    each shard is written to its own part file by the worker that made
+    it. Otherwise the shards are appended to a single file in order.
+    fmt is 'csv' or 'parquet' (parquet needs pyarrow).
+    '''
+    n_shards = -(-n_rows // shard_rows)
+    shards = range(n_shards)
+
+    if out.endswith(os.sep) or os.path.isdir(out):
+        os.makedirs(out, exist_ok=True)
+        write = partial(_write_part, fmt, out, schema, n_rows, shard_rows, seed)
+        return list(bounded_map(write, shards, workers))
+
+    make = partial(generate_shard, schema, n_rows, shard_rows, seed)
+    frames = bounded_map(make, shards, workers)
+    if fmt == 'csv':
+        for i, df in enumerate(frames):
+            df.to_csv(out, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for df in frames:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    return [out]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate data shaped like an existing csv.')
+    parser.add_argument('source', help='csv to learn from (or a saved .json schema)')
+    parser.add_argument('out', help='output file, or folder (ending in /) for part files')
+    parser.add_argument('--rows', type=lambda s: int(float(s)), default=1_000_000,
+                        help='number of rows, e.g. 1000000 or 1e9')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shard-rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-schema', help='also save the learned schema as json')
+    args = parser.parse_args(argv)
+
+    if args.source.endswith('.json'):
+        schema = load_schema(args.source)
+    else:
+        schema = learn_schema(args.source)
+    if args.save_schema:
+        save_schema(schema, args.save_schema)
+
+    paths = generate(schema, args.rows, args.out, args.format,
+                     args.workers, args.shard_rows, args.seed)
+    print('wrote {:,} rows to {}'.format(args.rows, paths[0] if len(paths) == 1 else args.out))
+
+
+if __name__ == '__main__':
+    main()
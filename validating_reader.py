@@ -0,0 +1,244 @@
+# Reading a csv and finding its problems in the same pass.
+# data_cleaning.py loads dirty_data.csv first and then looks for
+# missing cells and wrong types with isnull() and dtypes. Here every
+# column has a schema (declared, or inferred from the first rows) and
+# cells are checked while the file is parsed. The file is split into
+# byte ranges at line ends and each range is parsed and checked on its
+# own thread (pandas' csv parser lets other threads run meanwhile).
+#
+# Returns the typed DataFrame plus a report with one line per problem
+# cell (row, column, rule, value). Rules:
+#   missing        - blank/NaN in a required column
+#   not_a_number   - e.g. Age 'Thirty'
+#   number_format  - a number written like "60,000" or 50K (converted)
+#   out_of_range   - outside min/max (inferred: far outside the
+#                    quartiles, like Age 1000)
+#   not_a_date     - no known date format
+#   date_format    - a date written differently from the usual one
+#                    (2020/04/25 in a column of 2022-01-15s)
+#   not_allowed    - not one of the allowed values
+#   pattern        - doesn't match the regex pattern
+#   duplicate      - repeated value in a unique column
+#
+# Usage:
+#   df, report = read_validated('csv_files/dirty_data.csv', workers=4)
+#   report.groupby(['column', 'rule']).size()
+#   schema = infer_schema('csv_files/dirty_data.csv') # edit, then
+#   df, report = read_validated('csv_files/dirty_data.csv', schema)
+# Fields with line breaks inside quotes can't be split at line ends,
+# read files that have them with range_bytes=None (one range).
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import date_shapes, parse_dates
+from numeric_coercion import coerce_numeric, detect_decimal
+
+NA_STRINGS = ['', 'NaN', 'nan', 'NA', 'N/A', 'null', 'None']
+PLAIN_NUMBER = r'[+-]?(\d+\.?\d*|\.\d+)'
+RULES = [
+    'missing', 'not_a_number', 'number_format', 'out_of_range', 'not_a_date',
+    'date_format', 'not_allowed', 'pattern', 'duplicate',
+]
+
+# columns with at most this many distinct values become categories
+MAX_CATEGORIES = 50
+RANGE_BYTES = 32 * 2**20
+
+
+## Schema ############################################################
+def _fences(numbers):
+    # Tukey's far-out fences: 3 interquartile ranges past the quartiles
+    q1, q3 = np.nanpercentile(numbers, [25, 75])
+    return q1 - 3 * (q3 - q1), q3 + 3 * (q3 - q1)
+
+
+def infer_column(raw):
+    '''Works out the schema of one column from a sample of raw strings.'''
+    values = raw[~raw.isin(NA_STRINGS)]
+    spec = {'type': 'str', 'required': True}
+    if values.empty:
+        return spec
+
+    decimal = detect_decimal(values)
+    numbers, _ = coerce_numeric(values, decimal)
+    if numbers.notnull().mean() >= .8:
+        spec.update(type='int' if numbers.dtype == 'Int64' else 'float', decimal=decimal)
+        if numbers.dropna().is_unique and len(values) == len(raw):
+            # an id: keeps growing past the sample, so no range
+            spec['unique'] = True
+        else:
+            lo, hi = _fences(numbers.dropna().to_numpy(dtype='float64'))
+            spec.update(min=float(lo), max=float(hi))
+        return spec
+
+    dates, _ = parse_dates(values)
+    if dates.notnull().mean() >= .8:
+        shapes = date_shapes(values[dates.notnull()])
+        spec.update(type='date', formats=[shapes.value_counts().index[0]])
+        return spec
+
+    if values.nunique() <= min(MAX_CATEGORIES, len(values) / 2):
+        spec['type'] = 'category'
+    return spec
+
+
+def infer_schema(path, sample_rows=10_000, **read_kwargs):
+    '''Returns {column: spec} from the first sample_rows rows of a csv.'''
+    raw = pd.read_csv(path, nrows=sample_rows, dtype=str, keep_default_na=False, **read_kwargs)
+    return {col: infer_column(raw[col]) for col in raw.columns}
+
+
+## Checking ##########################################################
+def check_column(raw, spec):
+    '''
+    Converts a column of raw strings to its schema type. Returns a
+    tuple of the converted Series and {rule: boolean mask of rows}.
+    '''
+    # columns repeat the same few strings a lot, so every distinct
+    # string is converted and checked once, then mapped back to rows
+    codes, uniques = pd.factorize(raw)
+    values, rules = _check_values(pd.Series(uniques, dtype=raw.dtype), spec)
+    values = values.take(codes)
+    values.index = raw.index
+    values.name = raw.name
+    return values, {rule: pd.Series(mask.to_numpy(dtype=bool)[codes], index=raw.index)
+                    for rule, mask in rules.items()}
+
+
+def _check_values(raw, spec):
+    kind = spec.get('type', 'str')
+    missing = raw.isin(NA_STRINGS)
+    present = raw.mask(missing)
+    rules = {}
+    if spec.get('required', True):
+        rules['missing'] = missing
+
+    if kind in ('int', 'float'):
+        values, _ = coerce_numeric(present, spec.get('decimal', '.'))
+        if kind == 'float':
+            values = values.astype('Float64')
+        rules['not_a_number'] = values.isnull() & ~missing
+        rules['number_format'] = values.notnull() & ~present.str.strip().str.fullmatch(PLAIN_NUMBER).fillna(False)
+    elif kind == 'date':
+        values, _ = parse_dates(present)
+        rules['not_a_date'] = values.isnull() & ~missing
+        if spec.get('formats'):
+            rules['date_format'] = values.notnull() & ~date_shapes(present).isin(spec['formats'])
+    else:
+        values = present.astype('str')
+        if spec.get('values') is not None:
+            rules['not_allowed'] = ~missing & ~present.isin(spec['values'])
+        if spec.get('pattern'):
+            rules['pattern'] = ~missing & ~present.str.fullmatch(spec['pattern']).fillna(False)
+
+    if kind in ('int', 'float', 'date') and (spec.get('min') is not None or spec.get('max') is not None):
+        lo, hi = spec.get('min'), spec.get('max')
+        if kind == 'date':
+            lo, hi = (None if v is None else pd.Timestamp(v) for v in (lo, hi))
+        outside = pd.Series(False, index=raw.index)
+        if lo is not None:
+            outside |= (values < lo).fillna(False).astype(bool)
+        if hi is not None:
+            outside |= (values > hi).fillna(False).astype(bool)
+        rules['out_of_range'] = outside
+    return values, rules
+
+
+def _report(raw, column, rules):
+    found = [
+        pd.DataFrame({'row': np.flatnonzero(mask.to_numpy(dtype=bool)), 'column': column,
+                      'rule': rule, 'value': raw[mask.to_numpy(dtype=bool)].to_numpy()})
+        for rule, mask in rules.items() if mask.any()
+    ]
+    return found
+
+
+def _check_range(path, columns, schema, bounds, **read_kwargs):
+    '''Parses and checks the rows in bytes bounds[0]:bounds[1] of the file.'''
+    start, stop = bounds
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=str,
+                      keep_default_na=False, **read_kwargs)
+    out, reports = {}, []
+    for col in columns:
+        out[col], rules = check_column(raw[col], schema.get(col, {'type': 'str'}))
+        reports += _report(raw[col], col, rules)
+    return pd.DataFrame(out), reports
+
+
+## Reading ###########################################################
+def byte_ranges(path, n_ranges):
+    '''
+    Splits a csv (after its header line) into about n_ranges byte
+    ranges that each start at the beginning of a line.
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        bounds = [start]
+        step = max(1, (size - start) // max(1, n_ranges))
+        for target in range(start + step, size, step):
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline() # on to the start of the next line
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_validated(path, schema=None, workers=None, range_bytes=RANGE_BYTES, **read_kwargs):
+    '''
+    Reads a csv, converting and checking every column against schema
+    ({column: spec}, inferred if None) while parsing. Returns a tuple
+    of the DataFrame and the report of problem cells.
+
+    A spec has 'type' (int, float, date, category or str) and
+    optionally required (default True), min, max, values (allowed),
+    pattern, formats (allowed date shapes like '9999-99-99'), decimal
+    and unique. The file is split into byte ranges of about
+    range_bytes (at least one per worker), or not at all if None.
+    '''
+    schema = schema if schema is not None else infer_schema(path, **read_kwargs)
+    columns = list(pd.read_csv(path, nrows=0, **read_kwargs).columns)
+    workers = workers or os.cpu_count()
+    n_ranges = 1 if not range_bytes else max(workers, -(-os.path.getsize(path) // range_bytes))
+
+    check = partial(_check_range, path, columns, schema, **read_kwargs)
+    with ThreadPoolExecutor(workers) as pool:
+        parts = list(pool.map(check, byte_ranges(path, n_ranges)))
+
+    frames, reports, offset = [], [], 0
+    for frame, found in parts:
+        for report in found:
+            report['row'] += offset
+            reports.append(report)
+        frames.append(frame)
+        offset += len(frame)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    for col in columns:
+        spec = schema.get(col, {})
+        if spec.get('type') == 'category':
+            df[col] = pd.Categorical(df[col], categories=spec.get('values'))
+        if spec.get('unique'):
+            dupes = df[col].duplicated() & df[col].notnull()
+            if dupes.any():
+                reports.append(pd.DataFrame({'row': np.flatnonzero(dupes), 'column': col,
+                                             'rule': 'duplicate', 'value': df[col][dupes].astype(str).to_numpy()}))
+
+    report = pd.concat(reports, ignore_index=True) if reports else \
+        pd.DataFrame({'row': [], 'column': [], 'rule': [], 'value': []})
+    # in file order: by row, then by column
+    report['col_pos'] = report['column'].map({c: i for i, c in enumerate(columns)})
+    report = report.sort_values(['row', 'col_pos'], kind='stable', ignore_index=True)
+    return df, report.drop(columns='col_pos')
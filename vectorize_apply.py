@@ -0,0 +1,115 @@
+# Running simple row-wise functions as column arithmetic.
+# learn_pandas.py demeans salaries with Series.map(lambda ...) and
+# DataFrame.apply(demean_salary, axis='columns'), which call python
+# once per value/row. Functions like demean_salary only use operators
+# that also work on whole columns, so calling them once on the whole
+# DataFrame (or Series) gives the same answer much faster.
+#
+# smart_apply / smart_map try exactly that on a small sample first.
+# If calling the function on the sample frame matches the row by row
+# result it is run vectorized on everything, otherwise (exceptions,
+# if statements on values, different results) it falls back to the
+# normal apply/map. Every call is recorded with its speedup.
+# (func runs a few extra times on the sample, so it shouldn't have
+# side effects outside the row it is given.)
+#
+# Usage:
+#   s2 = smart_apply(salaries, demean_salary)
+#   s = smart_map(salaries.Salary, lambda salary: salary - salary_mean)
+#   print_report()
+import inspect
+import os
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+# one entry per call, see print_report()
+CallReport = namedtuple(
+    'CallReport', 'site func vectorized apply_seconds run_seconds speedup'
+)
+REPORT = []
+
+
+def _call_site():
+    # first frame outside this file, e.g. 'learn_pandas.py:212'
+    for frame in inspect.stack(context=0):
+        if frame.filename != __file__:
+            return '{}:{}'.format(os.path.basename(frame.filename), frame.lineno)
+    return '?'
+
+
+def _same(a, b):
+    try:
+        if isinstance(a, pd.DataFrame):
+            pd.testing.assert_frame_equal(a.infer_objects(), b.infer_objects(), check_dtype=False)
+        else:
+            pd.testing.assert_series_equal(a, b, check_dtype=False, check_names=False)
+        return True
+    except (AssertionError, TypeError, ValueError):
+        return False
+
+
+def _try_vectorized(func, sample, slow_result):
+    # func gets a copy since functions like demean_salary change the
+    # row they're given
+    try:
+        fast_result = func(sample.copy())
+    except Exception:
+        return False
+    if not isinstance(fast_result, type(slow_result)):
+        return False
+    # a reduction like row.sum() gives one value per column instead of per row
+    if not fast_result.index.equals(slow_result.index):
+        return False
+    return _same(slow_result, fast_result)
+
+
+def _run(obj, func, slow, sample_size, site):
+    sample = obj.sample(min(len(obj), sample_size), random_state=0).sort_index()
+    start = time.perf_counter()
+    slow_sample = slow(sample)
+    # estimated time of the row by row version on all the data
+    apply_seconds = (time.perf_counter() - start) * len(obj) / max(1, len(sample))
+
+    vectorized = _try_vectorized(func, sample, slow_sample)
+    start = time.perf_counter()
+    result = func(obj.copy()) if vectorized else slow(obj)
+    run_seconds = time.perf_counter() - start
+    if not vectorized:
+        # ran the slow way, so there's nothing to estimate
+        apply_seconds = run_seconds
+
+    REPORT.append(CallReport(
+        site or _call_site(), getattr(func, '__name__', repr(func)), vectorized,
+        apply_seconds, run_seconds, apply_seconds / max(run_seconds, 1e-9),
+    ))
+    return result
+
+
+def smart_apply(df, func, sample_size=100, site=None):
+    '''
+    Same result as df.apply(func, axis='columns'), but runs func(df)
+    once when that is equivalent on a sample of rows.
+    '''
+    slow = lambda frame: frame.apply(func, axis='columns')
+    return _run(df, func, slow, sample_size, site)
+
+
+def smart_map(series, func, sample_size=100, site=None):
+    '''
+    Same result as series.map(func), but runs func(series) once when
+    that is equivalent on a sample of values.
+    '''
+    slow = lambda s: s.map(func)
+    return _run(series, func, slow, sample_size, site)
+
+
+def print_report(report=REPORT):
+    '''Prints how each call ran and how much faster it was.'''
+    print('{:<24} {:<16} {:<11} {:>10} {:>10} {:>9}'.format(
+        'call site', 'function', 'mode', 'apply (s)', 'run (s)', 'speedup'))
+    for r in report:
+        print('{:<24} {:<16} {:<11} {:>10.4f} {:>10.4f} {:>8.1f}x'.format(
+            r.site, r.func[:16], 'vectorized' if r.vectorized else 'apply',
+            r.apply_seconds, r.run_seconds, r.speedup))